@@ -2,11 +2,41 @@
 Main module for database functions, including connection querying, inserting etc.
 """
 
+import uuid
 from configparser import ConfigParser
-from typing import Optional
+from typing import Dict, Iterable, Iterator, Optional, Sequence, Union
 
+import numpy as np  # type: ignore
+import pandas as pd  # type: ignore
 import psycopg2  # type: ignore
-from psycopg2 import Error  # type: ignore
+from psycopg2 import Error, sql  # type: ignore
+
+ARTICLE_COLUMNS = (
+    "article_title",
+    "article_date",
+    "source_url",
+    "article_text",
+    "news_source_id",
+    "negative",
+    "positive",
+)
+TREND_FREQUENCIES = ("day", "week", "month")
+STREAM_CHUNKSIZE = 50_000
+# postgres type oid -> pandas dtype used when streaming results
+PG_TYPE_DTYPES = {
+    16: "boolean",  # bool
+    20: "Int64",  # int8
+    21: "Int16",  # int2
+    23: "Int32",  # int4
+    700: "float32",  # float4
+    701: "float64",  # float8
+    1700: "float64",  # numeric
+    25: "string",  # text
+    1043: "string",  # varchar
+    1082: "datetime64[ns]",  # date
+    1114: "datetime64[ns]",  # timestamp
+    1184: "datetime64[ns, UTC]",  # timestamptz
+}
 
 
 def read_config(filename: str = "database.ini", section: str = "postgresql") -> dict:
@@ -50,6 +80,37 @@ def connect(params: dict) -> psycopg2.extensions.connection:
         return error
 
 
+def table_name(name: str) -> str:
+    """
+    returns a table name as postgres resolves it when unquoted (lower case). Names are
+    quoted with sql.Identifier, so this keeps e.g. a HS2 search term on the hs2 table
+    created by the original unquoted COPY.
+    """
+    return name.lower()
+
+
+def frame_from_rows(rows: Sequence[tuple], description: Sequence) -> pd.DataFrame:
+    """
+    builds a df from fetched rows, typing each column from the postgres type oid in
+    the cursor description. Integer columns use nullable dtypes so NULLs survive.
+    """
+    columns = list(zip(*rows)) if rows else [() for _ in description]
+    data = {}
+    for col, values in zip(description, columns):
+        dtype = PG_TYPE_DTYPES.get(col.type_code)
+        if dtype is not None and dtype.startswith("datetime64"):
+            data[col.name] = pd.to_datetime(
+                pd.Series(values, dtype=object), utc=dtype.endswith("UTC]")
+            )
+        elif dtype == "float64" and col.type_code == 1700:
+            data[col.name] = pd.Series(values, dtype=object).astype(dtype)
+        elif dtype is not None:
+            data[col.name] = pd.Series(values, dtype=dtype)
+        else:
+            data[col.name] = pd.Series(values, dtype=object)
+    return pd.DataFrame(data)
+
+
 class DataBase:
     """
     Main database class that handles all querying, inserting, etc
@@ -89,6 +150,70 @@ class DataBase:
                 self._conn.close()
                 print("PostgreSQL connection is closed")
 
+    def stream_query(
+        self,
+        query: Union[str, sql.Composable],
+        params: Optional[Union[Sequence, Dict]] = None,
+        chunksize: int = STREAM_CHUNKSIZE,
+        as_numpy: bool = False,
+    ) -> Iterator[Union[pd.DataFrame, Dict[str, np.ndarray]]]:
+        """
+        runs a query through a server-side (named) cursor and yields the results in
+        typed dfs of at most chunksize rows, so large tables never have to be held
+        in memory at once. With as_numpy=True each chunk is a dict of column name to
+        numpy array instead.
+        Unlike query, the connection is left open and no commit is made.
+        """
+        cursor_name = f"stream_{uuid.uuid4().hex}"
+        with self._conn.cursor(name=cursor_name) as stream_cursor:
+            stream_cursor.itersize = chunksize
+            stream_cursor.execute(query, params)
+            while True:
+                rows = stream_cursor.fetchmany(chunksize)
+                if not rows:
+                    break
+                chunk = frame_from_rows(rows, stream_cursor.description)
+                if as_numpy:
+                    # tz-aware columns become UTC datetime64 rather than object arrays
+                    yield {
+                        col: (
+                            chunk[col].dt.tz_convert(None).to_numpy()
+                            if isinstance(chunk[col].dtype, pd.DatetimeTZDtype)
+                            else chunk[col].to_numpy()
+                        )
+                        for col in chunk.columns
+                    }
+                else:
+                    yield chunk
+
+    def stream_articles(
+        self,
+        table: str,
+        columns: Sequence[str] = ARTICLE_COLUMNS,
+        start_date: Optional[str] = None,
+        end_date: Optional[str] = None,
+        chunksize: int = STREAM_CHUNKSIZE,
+        as_numpy: bool = False,
+    ) -> Iterator[Union[pd.DataFrame, Dict[str, np.ndarray]]]:
+        """
+        streams the given columns of an article table in article_date order,
+        optionally limited to articles between start_date and end_date (inclusive).
+        See stream_query.
+        """
+        query = sql.SQL(
+            """SELECT {columns} FROM {table}
+                WHERE (%(start_date)s::date IS NULL OR article_date >= %(start_date)s::date)
+                    AND (%(end_date)s::date IS NULL OR article_date <= %(end_date)s::date)
+                ORDER BY article_date"""
+        ).format(
+            columns=sql.SQL(",").join(sql.Identifier(col) for col in columns),
+            table=sql.Identifier(table_name(table)),
+        )
+        params = {"start_date": start_date, "end_date": end_date}
+        return self.stream_query(
+            query, params=params, chunksize=chunksize, as_numpy=as_numpy
+        )
+
     def close(self):
         """
         Manually closes the database connection. Not typically required as closing should
@@ -101,18 +226,225 @@ class DataBase:
         except (Exception, Error) as error:
             print("Error while connecting to PostgreSQL", error)
 
+    def create_schema(self, table: str) -> None:
+        """
+        creates the article table, its indexes and the daily sentiment rollup table
+        if they do not already exist. Safe to call before every load.
+        source_url is unique, so an existing table is deduplicated (keeping the first
+        inserted row) and fully rolled up the first time the unique index is created.
+        Does not commit, so it can share a transaction with a load.
+        """
+        table = table_name(table)
+        rollup = f"{table}_daily_sentiment"
+        identifiers = {
+            "table": sql.Identifier(table),
+            "rollup": sql.Identifier(rollup),
+            "date_idx": sql.Identifier(f"{table}_article_date_idx"),
+            "url_idx": sql.Identifier(f"{table}_source_url_idx"),
+            "url_key": sql.Identifier(f"{table}_source_url_key"),
+            "source_idx": sql.Identifier(f"{table}_news_source_id_idx"),
+        }
+        statements = [
+            """CREATE TABLE IF NOT EXISTS {table} (
+                    id SERIAL PRIMARY KEY,
+                    article_title TEXT,
+                    article_date DATE,
+                    source_url TEXT,
+                    article_text TEXT,
+                    news_source_id INTEGER,
+                    negative REAL,
+                    positive REAL)""",
+            "CREATE INDEX IF NOT EXISTS {date_idx} ON {table} (article_date)",
+            "CREATE INDEX IF NOT EXISTS {source_idx} ON {table} (news_source_id)",
+            """CREATE TABLE IF NOT EXISTS {rollup} (
+                    article_date DATE NOT NULL,
+                    news_source_id INTEGER NOT NULL,
+                    n_articles INTEGER NOT NULL,
+                    n_negative INTEGER,
+                    n_positive INTEGER,
+                    sum_negative DOUBLE PRECISION,
+                    sum_positive DOUBLE PRECISION,
+                    mean_negative DOUBLE PRECISION,
+                    mean_positive DOUBLE PRECISION,
+                    PRIMARY KEY (article_date, news_source_id))""",
+            "ALTER TABLE {rollup} ADD COLUMN IF NOT EXISTS n_negative INTEGER",
+            "ALTER TABLE {rollup} ADD COLUMN IF NOT EXISTS n_positive INTEGER",
+        ]
+        for statement in statements:
+            self.cursor.execute(sql.SQL(statement).format(**identifiers))
+
+        stale_dates = []
+        self.cursor.execute(
+            "SELECT 1 FROM pg_indexes WHERE indexname = %s",
+            (f"{table}_source_url_key",),
+        )
+        if self.cursor.fetchone() is None:
+            self.cursor.execute(
+                sql.SQL(
+                    """DELETE FROM {table} AS dup USING {table} AS kept
+                        WHERE dup.source_url = kept.source_url AND dup.id > kept.id"""
+                ).format(**identifiers)
+            )
+            # the table may predate the rollups, so every date is rolled up once here
+            self.cursor.execute(
+                sql.SQL("SELECT DISTINCT article_date FROM {table}").format(
+                    **identifiers
+                )
+            )
+            stale_dates.extend(row[0] for row in self.cursor.fetchall())
+            self.cursor.execute(
+                sql.SQL("DROP INDEX IF EXISTS {url_idx}").format(**identifiers)
+            )
+            self.cursor.execute(
+                sql.SQL("CREATE UNIQUE INDEX {url_key} ON {table} (source_url)").format(
+                    **identifiers
+                )
+            )
+        # rollup rows written before the score counts were added
+        self.cursor.execute(
+            sql.SQL(
+                "SELECT article_date FROM {rollup} WHERE n_negative IS NULL"
+            ).format(**identifiers)
+        )
+        stale_dates.extend(row[0] for row in self.cursor.fetchall())
+        self.refresh_rollups(
+            table, set(date for date in stale_dates if date is not None)
+        )
+
+    def refresh_rollups(self, table: str, dates: Iterable) -> None:
+        """
+        recomputes the daily sentiment rollup rows for the given article dates only.
+        Scores are counted separately from articles (n_negative, n_positive) so NULL
+        scores do not pull the means down.
+        Does not commit, so it can share a transaction with the load that touched the dates.
+        """
+        dates = list(dates)
+        if not dates:
+            return None
+        table = table_name(table)
+        identifiers = {
+            "table": sql.Identifier(table),
+            "rollup": sql.Identifier(f"{table}_daily_sentiment"),
+        }
+        self.cursor.execute(
+            sql.SQL("DELETE FROM {rollup} WHERE article_date = ANY(%s::date[])").format(
+                **identifiers
+            ),
+            (dates,),
+        )
+        self.cursor.execute(
+            sql.SQL(
+                """INSERT INTO {rollup} (article_date, news_source_id, n_articles,
+                        n_negative, n_positive, sum_negative, sum_positive,
+                        mean_negative, mean_positive)
+                    SELECT article_date, news_source_id, COUNT(*),
+                        COUNT(negative), COUNT(positive),
+                        SUM(negative), SUM(positive), AVG(negative), AVG(positive)
+                    FROM {table}
+                    WHERE article_date = ANY(%s::date[])
+                    GROUP BY article_date, news_source_id"""
+            ).format(**identifiers),
+            (dates,),
+        )
+        return None
+
     def send_csv_to_psql(self, search_term: str, news_source: str, table: str) -> None:
         """
-        Writing a saved csv file to database using copy_expert
+        Writing a saved csv file to database using copy_expert.
+        The csv is copied into a temporary staging table first. Articles whose
+        source_url is already in the table are skipped, and the rollups are only
+        refreshed for the article dates of the newly inserted articles.
         """
         csv_dir = f"scraping/results/sentiment_analysis_results/{search_term}_{news_source}_sentiment.csv"
-        sql = """COPY %s (article_title,article_date,source_url,article_text,news_source_id,negative,positive)
-                    FROM STDIN WITH CSV HEADER DELIMITER AS '|'"""
+        table = table_name(table)
+        columns = sql.SQL(",").join(sql.Identifier(col) for col in ARTICLE_COLUMNS)
+        identifiers = {
+            "table": sql.Identifier(table),
+            "staging": sql.Identifier(f"{table}_staging"),
+            "columns": columns,
+        }
         print("Writing to postgres db...")
+        self.create_schema(table)
+        self.cursor.execute(
+            sql.SQL(
+                """CREATE TEMP TABLE {staging} ON COMMIT DROP AS
+                    SELECT {columns} FROM {table} WITH NO DATA"""
+            ).format(**identifiers)
+        )
+        copy_sql = sql.SQL(
+            "COPY {staging} ({columns}) FROM STDIN WITH CSV HEADER DELIMITER AS '|'"
+        ).format(**identifiers)
         with open(csv_dir, "r", encoding="UTF-8") as f:
-            self.cursor.copy_expert(sql=sql % table, file=f)
-            print(f"{search_term}_{news_source} written to table: {table}")
-            return self._conn.commit()
+            self.cursor.copy_expert(sql=copy_sql, file=f)
+        self.cursor.execute(
+            sql.SQL(
+                """INSERT INTO {table} ({columns}) SELECT {columns} FROM {staging}
+                    ON CONFLICT (source_url) DO NOTHING
+                    RETURNING article_date"""
+            ).format(**identifiers)
+        )
+        inserted_dates = [row[0] for row in self.cursor.fetchall()]
+        touched_dates = {date for date in inserted_dates if date is not None}
+        self.refresh_rollups(table, touched_dates)
+        print(
+            f"{search_term}_{news_source}: {len(inserted_dates)} new articles "
+            f"written to table: {table}"
+        )
+        print(f"Rollups refreshed for {len(touched_dates)} dates")
+        return self._conn.commit()
+
+    def sentiment_trend(
+        self,
+        table: str,
+        freq: str = "day",
+        window: int = 7,
+        news_source_id: Optional[int] = None,
+    ) -> pd.DataFrame:
+        """
+        returns the sentiment trend per news source from the rollup table as a df.
+        freq is the period to group by (day, week or month) and window is the number of
+        periods in the rolling means. Means are weighted by the number of scored articles.
+        """
+        if freq not in TREND_FREQUENCIES:
+            raise ValueError(f"freq must be one of {TREND_FREQUENCIES}, got {freq}")
+        if window < 1:
+            raise ValueError("window must be at least 1")
+        query = sql.SQL(
+            """WITH buckets AS (
+                    SELECT date_trunc(%(freq)s, article_date)::date AS period,
+                        news_source_id,
+                        SUM(n_articles) AS n_articles,
+                        SUM(n_negative) AS n_negative,
+                        SUM(n_positive) AS n_positive,
+                        SUM(sum_negative) AS sum_negative,
+                        SUM(sum_positive) AS sum_positive
+                    FROM {rollup}
+                    WHERE %(news_source_id)s::integer IS NULL
+                        OR news_source_id = %(news_source_id)s::integer
+                    GROUP BY 1, 2)
+                SELECT period, news_source_id, n_articles,
+                    sum_negative / NULLIF(n_negative, 0) AS mean_negative,
+                    sum_positive / NULLIF(n_positive, 0) AS mean_positive,
+                    SUM(sum_negative) OVER w / NULLIF(SUM(n_negative) OVER w, 0)
+                        AS rolling_negative,
+                    SUM(sum_positive) OVER w / NULLIF(SUM(n_positive) OVER w, 0)
+                        AS rolling_positive
+                FROM buckets
+                WINDOW w AS (
+                    PARTITION BY news_source_id ORDER BY period
+                    RANGE BETWEEN %(preceding)s::interval PRECEDING AND CURRENT ROW)
+                ORDER BY period, news_source_id"""
+        ).format(rollup=sql.Identifier(f"{table_name(table)}_daily_sentiment"))
+        params = {
+            "freq": freq,
+            "news_source_id": news_source_id,
+            "preceding": f"{window - 1} {freq}",
+        }
+        self.cursor.execute(query, params)
+        columns = [col.name for col in self.cursor.description]
+        trend_df = pd.DataFrame(self.cursor.fetchall(), columns=columns)
+        trend_df["period"] = pd.to_datetime(trend_df["period"])
+        return trend_df
 
 
 # if __name__ == "__main__":
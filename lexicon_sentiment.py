@@ -0,0 +1,186 @@
+"""
+Fast lexicon based sentiment scoring, a cheap alternative to the transformer model
+in sentiment_analysis for dashboards and archive backfills.
+
+Follows the VADER approach: each known word has a valence, boosted by a preceding
+intensifier, flipped and damped by a negation in the three preceding words, and
+weighted around "but". The valences are summed per text and normalised into a
+compound score in [-1, 1].
+Texts are tokenised in one pass and scored as a sparse term matrix with numpy, so
+there is no python level work per word beyond a dict lookup.
+"""
+
+import string
+from itertools import repeat
+from pathlib import Path
+from typing import Dict, Iterable, Optional, Union
+
+import numpy as np  # type: ignore
+
+# punctuation and digits become whitespace so str.split can tokenise every text in
+# one call. Apostrophes are kept for negations such as "can't".
+TOKEN_TRANSLATION = str.maketrans(
+    {
+        **{char: " " for char in string.punctuation.replace("'", "") + string.digits},
+        **{char: " " for char in "\u201c\u201d\u2013\u2014\u2026"},
+        "\u2018": "'",
+        "\u2019": "'",
+    }
+)
+DOC_BREAK = "zzdocbreakzz"  # token placed between texts when tokenising in one pass
+NEGATION_SCALAR = -0.74
+NEGATION_WINDOW = 3
+BUT_BEFORE_SCALAR = 0.5
+BUT_AFTER_SCALAR = 1.5
+ALPHA = 15  # compound normalisation constant used by VADER
+
+NEGATIONS = {
+    "not", "no", "never", "none", "nobody", "nothing", "neither", "nor", "nowhere",
+    "cannot", "can't", "won't", "don't", "doesn't", "didn't", "isn't", "aren't",
+    "wasn't", "weren't", "hasn't", "haven't", "hadn't", "shouldn't", "wouldn't",
+    "couldn't", "without",
+}  # fmt: skip
+BOOSTERS = {
+    "very": 0.293, "extremely": 0.293, "hugely": 0.293, "massively": 0.293,
+    "highly": 0.293, "really": 0.293, "deeply": 0.293, "seriously": 0.293,
+    "significantly": 0.293, "totally": 0.293, "further": 0.293, "more": 0.293,
+    "most": 0.293, "slightly": -0.293, "barely": -0.293, "somewhat": -0.293,
+    "partly": -0.293, "less": -0.293, "marginally": -0.293,
+}  # fmt: skip
+# valences on the VADER -4..4 scale, weighted towards the language of
+# infrastructure project news. load_vader_lexicon can be used for the full lexicon.
+DEFAULT_LEXICON = {
+    "abandon": -1.9, "abandoned": -2.0, "accident": -2.1, "anger": -2.7,
+    "angry": -2.3, "approve": 1.8, "approved": 1.8, "award": 2.5, "awarded": 2.0,
+    "backlash": -1.9, "bad": -2.5, "benefit": 2.0, "benefits": 1.9, "best": 3.2,
+    "blow": -1.6, "boost": 1.7, "boosted": 1.6, "breakthrough": 2.2,
+    "chaos": -2.7, "collapse": -2.4, "collapsed": -2.3, "complete": 1.1,
+    "completed": 1.3, "concern": -1.4, "concerns": -1.4, "controversial": -1.4,
+    "corruption": -2.9, "crash": -2.1, "crisis": -3.1, "criticism": -1.9,
+    "criticised": -1.9, "criticized": -1.9, "cut": -1.1, "cuts": -1.2,
+    "damage": -2.2, "damning": -2.4, "danger": -2.4, "dangerous": -2.1,
+    "deadly": -2.7, "death": -2.9, "deaths": -2.7, "delay": -1.3,
+    "delayed": -1.4, "delays": -1.4, "deliver": 1.2, "delivered": 1.3,
+    "disaster": -3.1, "disruption": -1.6, "doubt": -1.5, "doubts": -1.5,
+    "efficient": 1.8, "excellent": 2.7, "fail": -2.5, "failed": -2.3,
+    "failing": -2.3, "failure": -2.3, "fear": -2.2, "fears": -1.9,
+    "fiasco": -2.8, "fine": 0.8, "fined": -1.6, "good": 1.9, "great": 3.1,
+    "growth": 1.6, "hit": -1.0, "improve": 1.9, "improved": 2.1,
+    "improvement": 2.0, "injured": -2.3, "investment": 1.1, "jobs": 0.9,
+    "landmark": 1.5, "launch": 1.0, "loss": -1.3, "losses": -1.7,
+    "milestone": 1.7, "mess": -1.5, "open": 0.8, "opened": 0.9, "opens": 0.9,
+    "opposition": -1.1, "outrage": -2.8, "overrun": -1.8, "overruns": -1.8,
+    "overspend": -1.7, "praise": 2.6, "praised": 2.2, "problem": -1.7,
+    "problems": -1.7, "progress": 1.8, "protest": -1.0, "protests": -1.1,
+    "risk": -1.1, "risks": -1.1, "row": -1.2, "safe": 1.9, "safety": 1.8,
+    "savings": 1.4, "scandal": -2.4, "scrap": -1.4, "scrapped": -1.8,
+    "setback": -1.7, "slammed": -1.8, "soar": 1.3, "strike": -1.3,
+    "strikes": -1.4, "success": 2.7, "successful": 2.8, "support": 1.7,
+    "threat": -2.4, "trouble": -1.7, "unsafe": -2.3, "vital": 1.2,
+    "warn": -1.4, "warning": -1.4, "warns": -1.4, "waste": -1.8,
+    "wasted": -2.2, "welcome": 2.0, "welcomed": 2.0, "win": 2.8, "wins": 2.7,
+    "worse": -2.1, "worst": -3.1, "wrong": -2.1,
+}  # fmt: skip
+
+
+def load_vader_lexicon(filename: Union[str, Path]) -> Dict[str, float]:
+    """
+    reads a lexicon in the vader_lexicon.txt format (token, mean valence, std,
+    raw ratings separated by tabs) and returns a dict of token to mean valence
+    """
+    lexicon = {}
+    with open(filename, encoding="utf-8") as f:
+        for line in f:
+            fields = line.rstrip("\n").split("\t")
+            if len(fields) >= 2:
+                lexicon[fields[0].lower()] = float(fields[1])
+    return lexicon
+
+
+class LexiconScorer:
+    """
+    vectorised VADER style scorer. predict returns the same (negative, positive)
+    columns as the transformer model in sentiment_analysis.
+    """
+
+    def __init__(self, lexicon: Optional[Dict[str, float]] = None):
+        lexicon = DEFAULT_LEXICON if lexicon is None else lexicon
+        vocab = sorted(set(lexicon) | NEGATIONS | set(BOOSTERS) | {"but", DOC_BREAK})
+        # id 0 is reserved for words outside the vocab
+        self.vocab = {word: i for i, word in enumerate(vocab, start=1)}
+        self.valence = np.zeros(len(vocab) + 1, dtype=np.float32)
+        self.booster = np.zeros(len(vocab) + 1, dtype=np.float32)
+        self.is_negation = np.zeros(len(vocab) + 1, dtype=bool)
+        self.is_but = np.zeros(len(vocab) + 1, dtype=bool)
+        for i, word in enumerate(vocab, start=1):
+            self.valence[i] = lexicon.get(word, 0.0)
+            self.booster[i] = BOOSTERS.get(word, 0.0)
+            self.is_negation[i] = word in NEGATIONS
+            self.is_but[i] = word == "but"
+        self.doc_break_id = self.vocab[DOC_BREAK]
+
+    def _term_ids(self, texts: Iterable[str]) -> tuple:
+        """
+        tokenises all texts in one pass and returns the vocab id and document number
+        of every token, plus the number of documents
+        """
+        texts = [text if isinstance(text, str) else "" for text in texts]
+        tokens = (
+            f" {DOC_BREAK} ".join(texts).lower().translate(TOKEN_TRANSLATION).split()
+        )
+        ids = np.fromiter(
+            map(self.vocab.get, tokens, repeat(0)), dtype=np.int32, count=len(tokens)
+        )
+        is_break = ids == self.doc_break_id
+        doc_ids = np.cumsum(is_break)[~is_break]
+        return ids[~is_break], doc_ids, len(texts)
+
+    def compound(self, texts: Iterable[str]) -> np.ndarray:
+        """
+        returns the VADER style compound score in [-1, 1] of each text
+        """
+        ids, doc_ids, n_docs = self._term_ids(texts)
+        valence = self.valence[ids]
+        if len(ids):
+            # boosters push the following word further from neutral
+            boost = np.zeros(len(ids), dtype=np.float32)
+            boost[1:] = np.where(
+                doc_ids[1:] == doc_ids[:-1], self.booster[ids[:-1]], 0.0
+            )
+            valence = valence + np.sign(valence) * boost
+            # a negation in the preceding NEGATION_WINDOW words flips and damps the valence
+            negated = np.zeros(len(ids), dtype=bool)
+            for shift in range(1, NEGATION_WINDOW + 1):
+                negated[shift:] |= self.is_negation[ids[:-shift]] & (
+                    doc_ids[shift:] == doc_ids[:-shift]
+                )
+            valence = np.where(negated, valence * NEGATION_SCALAR, valence)
+            # words before a "but" are weighted down and words after it up
+            is_but = self.is_but[ids]
+            buts_so_far = np.cumsum(is_but) - is_but
+            doc_start = np.searchsorted(doc_ids, doc_ids)
+            buts_before = buts_so_far - buts_so_far[doc_start]
+            doc_has_but = np.bincount(doc_ids, weights=is_but, minlength=n_docs) > 0
+            weight = np.where(
+                buts_before > 0,
+                BUT_AFTER_SCALAR,
+                np.where(doc_has_but[doc_ids], BUT_BEFORE_SCALAR, 1.0),
+            )
+            valence = valence * weight
+        totals = np.bincount(doc_ids, weights=valence, minlength=n_docs)
+        return (totals / np.sqrt(totals * totals + ALPHA)).astype(np.float32)
+
+    def predict(self, texts: Iterable[str]) -> np.ndarray:
+        """
+        returns an (n, 2) float32 array of [negative, positive] scores for the texts,
+        matching the transformer output. Neutral texts score 0.5/0.5.
+        """
+        positive = (self.compound(texts) + 1) / 2
+        return np.column_stack([1 - positive, positive]).astype(np.float32)
+
+    @staticmethod
+    def confidence(sentiment_results: np.ndarray) -> np.ndarray:
+        """
+        returns how far each [negative, positive] prediction is from neutral, in [0, 1]
+        """
+        return np.abs(sentiment_results[:, 1] - sentiment_results[:, 0])
@@ -0,0 +1,146 @@
+"""
+Measures the peak memory of scoring a results csv, comparing the original
+whole-csv path with the chunked, memory lean path used by sentiment_analysis.main.
+
+A synthetic results csv of n articles is written to a temporary directory and each
+path is run in its own process, so the peak resident set sizes are independent.
+The lexicon engine is used for both paths so the transformer model does not
+dominate the measurement:
+    python memory_benchmark.py --articles 100000
+"""
+import argparse
+import datetime
+import os
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+import numpy as np  # type: ignore
+import pandas as pd  # type: ignore
+
+import sentiment_analysis
+
+PATHS = ("whole", "chunked")
+N_ARTICLES = 100_000
+SEARCH_TERM = "benchmark"
+NEWS_SOURCE = "guardian"
+
+
+def make_results_csv(n_articles: int, results_dir: Path) -> None:
+    """
+    writes a synthetic results csv of n_articles articles, with article bodies of a
+    few thousand characters like those the scrapers save
+    """
+    rng = np.random.default_rng(0)
+    first_date = datetime.date(2010, 1, 1)
+    results_df = pd.DataFrame(
+        {
+            "article_title": [
+                f"Project delays are a great concern, article {i}"
+                for i in range(n_articles)
+            ],
+            "article_date": [
+                first_date + datetime.timedelta(days=i % 4000)
+                for i in range(n_articles)
+            ],
+            "source_url": [
+                f"https://www.theguardian.com/uk-news/{i}" for i in range(n_articles)
+            ],
+            "article_text": [
+                "word " * int(rng.integers(300, 900)) + str(i)
+                for i in range(n_articles)
+            ],
+            "news_source_id": 1,
+        }
+    )
+    results_df.to_csv(
+        Path(results_dir, f"{SEARCH_TERM}_{NEWS_SOURCE}.csv"), index=False, sep="|"
+    )
+
+
+def score_whole_csv() -> None:
+    """
+    the original path: the whole csv is read with inferred dtypes, every title is
+    scored and the results are concatenated onto a copy of the df
+    """
+    scorer = sentiment_analysis.LexiconScorer()
+    df = pd.read_csv(f"scraping/results/{SEARCH_TERM}_{NEWS_SOURCE}.csv", sep="|")
+    sentiment_results = pd.Series(list(map(tuple, scorer.predict(df["article_title"]))))
+    sentiment_df = pd.DataFrame(
+        sentiment_results.to_list(), columns=["negative", "positive"]
+    )
+    df = pd.concat([df, sentiment_df], axis=1, join="inner")
+    sentiment_analysis.write_csv(df, search_term=SEARCH_TERM, news_source=NEWS_SOURCE)
+
+
+def score_chunked_csv() -> None:
+    """
+    the memory lean path: sentiment_analysis.main with the lexicon engine
+    """
+    sentiment_analysis.main(NEWS_SOURCE, SEARCH_TERM, engine="lexicon")
+
+
+def peak_rss_mb() -> float:
+    """
+    returns the peak resident set size of this process in MB. VmHWM is read rather
+    than ru_maxrss, as ru_maxrss is inherited from the parent process across exec.
+    """
+    with open("/proc/self/status", encoding="utf-8") as status:
+        for line in status:
+            if line.startswith("VmHWM:"):
+                return int(line.split()[1]) / 1024
+    raise RuntimeError("peak memory is only available on linux")
+
+
+def run_path(path: str) -> None:
+    """
+    runs one scoring path in this process and prints its peak memory growth
+    """
+    baseline = peak_rss_mb()
+    if path == "whole":
+        score_whole_csv()
+    else:
+        score_chunked_csv()
+    print(
+        f"{path}: peak rss {peak_rss_mb():.0f} MB, growth {peak_rss_mb() - baseline:.0f} MB"
+    )
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--articles", type=int, default=N_ARTICLES)
+    parser.add_argument("--path", choices=PATHS, help=argparse.SUPPRESS)
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    if args.path is not None:
+        run_path(args.path)
+        return
+    repo_dir = Path(__file__).resolve().parent
+    with tempfile.TemporaryDirectory() as work_dir:
+        results_dir = Path(work_dir, "scraping", "results")
+        Path(results_dir, "sentiment_analysis_results").mkdir(parents=True)
+        make_results_csv(args.articles, results_dir)
+        python_path = os.pathsep.join(
+            filter(None, [str(repo_dir), os.environ.get("PYTHONPATH")])
+        )
+        env = dict(os.environ, PYTHONPATH=python_path)
+        for path in PATHS:
+            subprocess.run(
+                [
+                    sys.executable,
+                    str(Path(repo_dir, "memory_benchmark.py")),
+                    "--path",
+                    path,
+                ],
+                cwd=work_dir,
+                env=env,
+                check=True,
+            )
+
+
+if __name__ == "__main__":
+    main()
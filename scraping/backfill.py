@@ -0,0 +1,241 @@
+"""
+Module for historical backfills of a search term over a date range.
+
+The backfill is split into partitions which are crawled in parallel:
+    guardian: date windows, using the api's from-date/to-date parameters.
+    bbc: ranges of search pages, as bbc search results cannot be bounded by date.
+        Only the first BBC_MAX_PAGES search pages are crawled and articles published
+        outside the backfill dates are dropped, so older articles may be missed.
+Each finished partition is saved as a checkpoint csv in
+scraping/results/backfill/{search_term}_{news_source}_{start_date}_{end_date}/, so
+rerunning an interrupted backfill only crawls the partitions still missing, while a
+backfill over different dates starts afresh. Once every partition is done the
+checkpoints are combined into scraping/results/{search_term}_{news_source}.csv, the
+same file a normal scrape writes, so the rest of the pipeline runs unchanged.
+"""
+
+import datetime
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import partial
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+import pandas as pd  # type: ignore
+from tqdm import tqdm  # type: ignore
+
+from scraping import bbc, guardian
+from scraping.corpus_store import CorpusStore
+from scraping.quota import QuotaExceededError
+from scraping.scraper import (
+    CSV_READ_DTYPES,
+    df_from_article_dict,
+    lean_article_df,
+    read_config_yaml,
+    save_results_csv,
+)
+
+WINDOW_DAYS = 30
+MAX_WORKERS = 4
+BBC_MAX_PAGES = 50
+BBC_PAGES_PER_PARTITION = 5
+BACKFILL_DIR = Path(Path.cwd(), "scraping", "results", "backfill")
+
+
+def date_windows(
+    start_date: datetime.date, end_date: datetime.date, window_days: int = WINDOW_DAYS
+) -> List[Tuple[datetime.date, datetime.date]]:
+    """
+    splits start_date to end_date (inclusive) into consecutive windows of at most
+    window_days days
+    """
+    if end_date < start_date:
+        raise ValueError("end_date must not be before start_date")
+    windows = []
+    window_start = start_date
+    while window_start <= end_date:
+        window_end = min(
+            end_date, window_start + datetime.timedelta(days=window_days - 1)
+        )
+        windows.append((window_start, window_end))
+        window_start = window_end + datetime.timedelta(days=1)
+    return windows
+
+
+def guardian_partitions(
+    search_term: str,
+    start_date: datetime.date,
+    end_date: datetime.date,
+    window_days: int = WINDOW_DAYS,
+) -> Dict[str, Callable[[], Dict]]:
+    """
+    returns a crawl function per date window, keyed by the window's checkpoint name.
+    All windows share one rate limiter for the guardian key.
+    """
+    secrets = read_config_yaml("secrets.yml")
+    rate_limiter = guardian.guardian_rate_limiter(secrets)
+    return {
+        f"{from_date.isoformat()}_{to_date.isoformat()}": partial(
+            guardian.build_window_results_dict,
+            search_term=search_term,
+            api_key=secrets["guardian_api"],
+            from_date=from_date,
+            to_date=to_date,
+            rate_limiter=rate_limiter,
+        )
+        for from_date, to_date in date_windows(start_date, end_date, window_days)
+    }
+
+
+def bbc_partitions(
+    search_term: str,
+    max_pages: int = BBC_MAX_PAGES,
+    pages_per_partition: int = BBC_PAGES_PER_PARTITION,
+) -> Dict[str, Callable[[], Dict]]:
+    """
+    returns a crawl function per range of bbc search pages, keyed by the range's
+    checkpoint name
+    """
+    partitions = {}
+    for first_page in range(1, max_pages + 1, pages_per_partition):
+        pages = range(first_page, min(first_page + pages_per_partition, max_pages + 1))
+        partitions[f"pages_{pages[0]:04d}_{pages[-1]:04d}"] = partial(
+            bbc.build_article_results_dict, search_term=search_term, pages=pages
+        )
+    return partitions
+
+
+def checkpoint_dir_for(
+    news_source: str,
+    search_term: str,
+    start_date: datetime.date,
+    end_date: datetime.date,
+) -> Path:
+    """
+    returns the checkpoint directory of a backfill. The dates are part of the name so
+    checkpoints are only reused by a rerun of the same backfill.
+    """
+    return Path(
+        BACKFILL_DIR,
+        f"{search_term}_{news_source}_{start_date.isoformat()}_{end_date.isoformat()}",
+    )
+
+
+def run_partition(
+    checkpoint_dir: Path, name: str, crawl: Callable[[], Dict]
+) -> Optional[int]:
+    """
+    crawls one partition and saves it as a checkpoint csv. The csv is written to a
+    temporary file and renamed, so a checkpoint only exists once it is complete.
+    Returns the number of articles saved, or None if the checkpoint already existed.
+    """
+    checkpoint = checkpoint_dir / f"{name}.csv"
+    if checkpoint.exists():
+        return None
+    results = df_from_article_dict(crawl())
+    tmp_checkpoint = checkpoint.with_suffix(".tmp")
+    results.to_csv(tmp_checkpoint, index=False, sep="|")
+    tmp_checkpoint.replace(checkpoint)
+    return len(results)
+
+
+def combine_checkpoints(
+    checkpoint_dir: Path, start_date: datetime.date, end_date: datetime.date
+) -> pd.DataFrame:
+    """
+    combines the checkpoint csvs into one results df of the articles published between
+    start_date and end_date, without duplicate urls, in date order
+    """
+    frames = [
+        pd.read_csv(
+            checkpoint, sep="|", dtype=CSV_READ_DTYPES, parse_dates=["article_date"]
+        )
+        for checkpoint in sorted(checkpoint_dir.glob("*.csv"))
+    ]
+    results_df = pd.concat(frames, ignore_index=True)
+    in_range = results_df["article_date"].between(
+        pd.Timestamp(start_date), pd.Timestamp(end_date)
+    )
+    results_df = (
+        results_df[in_range]
+        .drop_duplicates(subset="source_url")
+        .sort_values("article_date", kind="stable")
+        .reset_index(drop=True)
+    )
+    return lean_article_df(results_df)
+
+
+def backfill(
+    news_source: str,
+    search_term: str,
+    start_date: datetime.date,
+    end_date: datetime.date,
+    window_days: int = WINDOW_DAYS,
+    max_workers: int = MAX_WORKERS,
+) -> Optional[pd.DataFrame]:
+    """
+    crawls all articles for search_term published between start_date and end_date,
+    see module docstring. Partitions that fail are left without a checkpoint and are
+    retried on the next run. Once the guardian api budget runs out (QuotaExceededError)
+    the partitions not yet started fail straight away rather than being tried in turn.
+    Returns the combined results df, or None if any partition failed.
+    """
+    if news_source == "guardian":
+        partitions = guardian_partitions(search_term, start_date, end_date, window_days)
+    elif news_source == "bbc":
+        partitions = bbc_partitions(search_term)
+        print(
+            f"BBC search cannot be bounded by date, only the first {BBC_MAX_PAGES} "
+            "search pages are crawled. Older articles in the range may be missed."
+        )
+    else:
+        raise ValueError("Only bbc and guardian news sources can be backfilled.")
+    checkpoint_dir = checkpoint_dir_for(news_source, search_term, start_date, end_date)
+    checkpoint_dir.mkdir(parents=True, exist_ok=True)
+    pending = {
+        name: crawl
+        for name, crawl in partitions.items()
+        if not Path(checkpoint_dir, f"{name}.csv").exists()
+    }
+    print(
+        f"Backfilling {news_source} for {search_term}: {len(partitions) - len(pending)} "
+        f"of {len(partitions)} partitions already done"
+    )
+    quota_used_up = threading.Event()
+
+    def crawl_within_quota(crawl: Callable[[], Dict]) -> Dict:
+        # once the key's budget is used up the partitions not yet started would only
+        # fail after their own retries, so they fail straight away instead
+        if quota_used_up.is_set():
+            raise QuotaExceededError("not started, the api budget is used up")
+        try:
+            return crawl()
+        except QuotaExceededError:
+            quota_used_up.set()
+            raise
+
+    failed = []
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {
+            executor.submit(
+                run_partition, checkpoint_dir, name, partial(crawl_within_quota, crawl)
+            ): name
+            for name, crawl in pending.items()
+        }
+        for future in tqdm(as_completed(futures), total=len(futures)):
+            name = futures[future]
+            try:
+                future.result()
+            except QuotaExceededError as error:
+                print(f"Partition {name} stopped: {error}")
+                failed.append(name)
+            except Exception as error:  # pylint: disable=broad-except
+                print(f"Partition {name} failed: {error!r}")
+                failed.append(name)
+    if failed:
+        print(f"{len(failed)} partitions not finished, rerun the backfill to resume")
+        return None
+    results = combine_checkpoints(checkpoint_dir, start_date, end_date)
+    save_results_csv(results, fname=f"{search_term}_{news_source}")
+    CorpusStore().append_df(results)
+    return results
@@ -18,6 +18,7 @@ import requests  # type: ignore
 from bs4 import BeautifulSoup as bs  # type: ignore
 from tqdm import tqdm  # type: ignore
 
+from scraping.corpus_store import CorpusStore
 from scraping.scraper import df_from_article_dict  # type: ignore
 from scraping.scraper import Scraper, save_results_csv
 
@@ -160,4 +161,5 @@ def main(
     )
     results = df_from_article_dict(article_results_dict)
     save_results_csv(results, fname=f"{search_term}_bbc")
+    CorpusStore().append_df(results)
     return None
@@ -0,0 +1,314 @@
+"""
+Module for the local article corpus store.
+
+Article text is kept zstd compressed in append-only segment files, one compressed
+frame per article. A fixed width index file holds the url hash, article date,
+news source id and the location of each frame. The index is memory mapped so
+lookups by url and date range scans only decompress the articles they return.
+Each segment has a sidecar of its url hashes, sorted, with their index positions,
+so url lookups and duplicate checks are binary searches rather than index scans.
+
+Layout of the store directory:
+    index.bin              fixed width index records (see INDEX_DTYPE)
+    segment_00000.zst      concatenated zstd frames
+    segment_00000.hashes   sorted url hashes of the segment (see HASH_DTYPE)
+    segment_00001.zst      ...
+    .lock                  lock file so both scrapers can append safely
+"""
+
+import datetime
+import hashlib
+import json
+import os
+from pathlib import Path
+from typing import IO, Iterator, List, Optional, Union
+
+try:
+    import fcntl
+except ImportError:  # windows
+    import msvcrt
+
+    fcntl = None
+
+import numpy as np  # type: ignore
+import pandas as pd  # type: ignore
+import zstandard as zstd  # type: ignore
+
+INDEX_DTYPE = np.dtype(
+    [
+        ("url_hash", "<u8"),
+        ("article_date", "<i4"),  # days since 1970-01-01
+        ("news_source_id", "<i2"),
+        ("segment", "<u2"),
+        ("offset", "<u8"),
+        ("length", "<u4"),
+    ]
+)
+# sidecar record: url hash and the position of its record in the index
+HASH_DTYPE = np.dtype([("url_hash", "<u8"), ("record", "<u8")])
+SEGMENT_MAX_BYTES = 64 * 1024 * 1024
+COMPRESSION_LEVEL = 3
+DEFAULT_STORE_DIR = Path(Path.cwd(), "scraping", "results", "corpus")
+
+DateLike = Union[str, datetime.date, np.datetime64]
+
+
+def url_hash(url: str) -> int:
+    """
+    returns a stable 64 bit hash of the article url
+    """
+    return int.from_bytes(
+        hashlib.blake2b(url.encode("utf-8"), digest_size=8).digest(), "little"
+    )
+
+
+def _to_days(dates) -> np.ndarray:
+    """
+    converts dates (datetime.date, iso strings or datetime64) to days since epoch
+    """
+    days = pd.to_datetime(pd.Series(dates)).to_numpy(dtype="datetime64[D]")
+    return days.astype(np.int32)
+
+
+def _lock(lock_file: IO) -> None:
+    """
+    takes an exclusive lock on an open lock file, released when the file is closed
+    """
+    if fcntl is not None:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+    else:
+        # retries for 10 seconds before raising OSError
+        msvcrt.locking(lock_file.fileno(), msvcrt.LK_LOCK, 1)
+
+
+def _read_array(path: Path, dtype: np.dtype) -> np.ndarray:
+    """
+    returns the whole records of a file as a read only memory mapped array
+    """
+    n_records = path.stat().st_size // dtype.itemsize if path.exists() else 0
+    if n_records == 0:
+        return np.empty(0, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode="r", shape=(n_records,))
+
+
+class CorpusStore:
+    """
+    Append-only, compressed store of scraped articles with a memory mapped index
+    """
+
+    def __init__(self, store_dir: Union[str, Path] = DEFAULT_STORE_DIR):
+        self.store_dir = Path(store_dir)
+        self.store_dir.mkdir(parents=True, exist_ok=True)
+        self.index_path = self.store_dir / "index.bin"
+        self.lock_path = self.store_dir / ".lock"
+        self._compressor = zstd.ZstdCompressor(level=COMPRESSION_LEVEL)
+        self._decompressor = zstd.ZstdDecompressor()
+
+    def __len__(self) -> int:
+        return len(self.index())
+
+    def _segment_path(self, segment: int) -> Path:
+        return self.store_dir / f"segment_{segment:05d}.zst"
+
+    def _hashes_path(self, segment: int) -> Path:
+        return self.store_dir / f"segment_{segment:05d}.hashes"
+
+    def _current_segment(self) -> int:
+        """
+        returns the segment number new frames should be appended to
+        """
+        segments = sorted(self.store_dir.glob("segment_*.zst"))
+        if not segments:
+            return 0
+        latest = int(segments[-1].stem.split("_")[1])
+        if segments[-1].stat().st_size >= SEGMENT_MAX_BYTES:
+            return latest + 1
+        return latest
+
+    def index(self) -> np.ndarray:
+        """
+        returns the index as a read only memory mapped structured array.
+        A partially written trailing record (e.g. from a killed process) is ignored.
+        """
+        return _read_array(self.index_path, INDEX_DTYPE)
+
+    def _sidecars(self) -> List[np.ndarray]:
+        """
+        returns the sorted url hash sidecar of every segment. Sidecars are written
+        after the index, one append at a time, so together they cover the first
+        sum(len(sidecar)) index records.
+        """
+        return [
+            _read_array(path, HASH_DTYPE)
+            for path in sorted(self.store_dir.glob("segment_*.hashes"))
+        ]
+
+    def _find(self, hashes: np.ndarray) -> np.ndarray:
+        """
+        returns the index positions of the records whose url hash is in hashes
+        """
+        positions = []
+        sidecars = self._sidecars()
+        for sidecar in sidecars:
+            first = np.searchsorted(sidecar["url_hash"], hashes, side="left")
+            last = np.searchsorted(sidecar["url_hash"], hashes, side="right")
+            for start, stop in zip(first[first < last], last[first < last]):
+                positions.append(np.asarray(sidecar["record"][start:stop]))
+        # records of an append that stopped before updating its sidecar
+        covered = sum(len(sidecar) for sidecar in sidecars)
+        tail = self.index()[covered:]
+        positions.append(covered + np.flatnonzero(np.isin(tail["url_hash"], hashes)))
+        return np.concatenate(positions).astype(np.int64)
+
+    def _update_sidecars(self, index: np.ndarray, start: int) -> None:
+        """
+        adds the index records from position start onwards to their segments'
+        sidecars. Each sidecar is rewritten sorted and replaced atomically.
+        """
+        new_records = index[start:]
+        for segment in np.unique(new_records["segment"]):
+            in_segment = np.flatnonzero(new_records["segment"] == segment)
+            added = np.empty(len(in_segment), dtype=HASH_DTYPE)
+            added["url_hash"] = new_records["url_hash"][in_segment]
+            added["record"] = start + in_segment
+            path = self._hashes_path(int(segment))
+            sidecar = np.concatenate([_read_array(path, HASH_DTYPE), added])
+            sidecar = sidecar[np.argsort(sidecar["url_hash"], kind="stable")]
+            tmp_path = path.with_suffix(".tmp")
+            sidecar.tofile(tmp_path)
+            os.replace(tmp_path, path)
+
+    def append_df(self, results_df: pd.DataFrame) -> int:
+        """
+        appends the articles of a results df (as built by df_from_article_dict) to the
+        store. Articles whose source_url is already stored are skipped.
+        Returns the number of articles written.
+        """
+        if results_df.empty:
+            return 0
+        hashes = np.fromiter(
+            (url_hash(url) for url in results_df["source_url"]),
+            dtype=np.uint64,
+            count=len(results_df),
+        )
+        dates = _to_days(results_df["article_date"])
+        source_ids = np.asarray(results_df["news_source_id"], dtype=np.int16)
+
+        with open(self.lock_path, "w", encoding="utf-8") as lock:
+            _lock(lock)
+            _, first_seen = np.unique(hashes, return_index=True)
+            is_new = np.zeros(len(hashes), dtype=bool)
+            is_new[first_seen] = True
+            stored = self.index()["url_hash"][self._find(hashes)]
+            is_new &= ~np.isin(hashes, stored)
+            if not is_new.any():
+                return 0
+
+            segment = self._current_segment()
+            records = np.zeros(int(is_new.sum()), dtype=INDEX_DTYPE)
+            segment_path = self._segment_path(segment)
+            with open(segment_path, "ab") as seg_file:
+                offset = seg_file.tell()
+                for i, row_num in enumerate(np.flatnonzero(is_new)):
+                    row = results_df.iloc[row_num]
+                    payload = json.dumps(
+                        {
+                            "article_title": str(row["article_title"]),
+                            "source_url": str(row["source_url"]),
+                            "article_text": str(row["article_text"]),
+                        }
+                    ).encode("utf-8")
+                    frame = self._compressor.compress(payload)
+                    seg_file.write(frame)
+                    records[i] = (
+                        hashes[row_num],
+                        dates[row_num],
+                        source_ids[row_num],
+                        segment,
+                        offset,
+                        len(frame),
+                    )
+                    offset += len(frame)
+            # frames are written before their index records so a reader never
+            # sees a record pointing at missing data
+            with open(self.index_path, "ab") as index_file:
+                # drop a partially written trailing record so new records stay aligned
+                index_file.truncate(
+                    index_file.tell() // INDEX_DTYPE.itemsize * INDEX_DTYPE.itemsize
+                )
+                index_file.write(records.tobytes())
+            index = self.index()
+            self._update_sidecars(
+                index, sum(len(sidecar) for sidecar in self._sidecars())
+            )
+        return len(records)
+
+    def _read_records(self, records: np.ndarray) -> Iterator[dict]:
+        """
+        decompresses the frames for the given index records, reading each segment
+        sequentially
+        """
+        order = np.lexsort((records["offset"], records["segment"]))
+        open_segment = None
+        seg_file = None
+        try:
+            for record in records[order]:
+                if record["segment"] != open_segment:
+                    if seg_file is not None:
+                        seg_file.close()
+                    open_segment = record["segment"]
+                    seg_file = open(self._segment_path(int(open_segment)), "rb")
+                seg_file.seek(int(record["offset"]))
+                article = json.loads(
+                    self._decompressor.decompress(seg_file.read(int(record["length"])))
+                )
+                article["article_date"] = np.datetime64(
+                    int(record["article_date"]), "D"
+                )
+                article["news_source_id"] = int(record["news_source_id"])
+                yield article
+        finally:
+            if seg_file is not None:
+                seg_file.close()
+
+    def get(self, source_url: str) -> Optional[dict]:
+        """
+        returns a single article by url, or None if the url is not stored
+        """
+        matches = self._find(np.array([url_hash(source_url)], dtype=np.uint64))
+        for article in self._read_records(np.asarray(self.index()[matches])):
+            if article["source_url"] == source_url:
+                return article
+        return None
+
+    def date_range(
+        self,
+        start_date: Optional[DateLike] = None,
+        end_date: Optional[DateLike] = None,
+        news_source_id: Optional[int] = None,
+    ) -> pd.DataFrame:
+        """
+        returns all articles published between start_date and end_date (inclusive),
+        optionally only from one news source, as a df in the sql db column order.
+        Only the matching articles are decompressed.
+        """
+        index = self.index()
+        mask = np.ones(len(index), dtype=bool)
+        if start_date is not None:
+            mask &= index["article_date"] >= _to_days([start_date])[0]
+        if end_date is not None:
+            mask &= index["article_date"] <= _to_days([end_date])[0]
+        if news_source_id is not None:
+            mask &= index["news_source_id"] == news_source_id
+        articles: List[dict] = list(self._read_records(np.asarray(index[mask])))
+        sql_db_column_order = [
+            "article_title",
+            "article_date",
+            "source_url",
+            "article_text",
+            "news_source_id",
+        ]
+        results_df = pd.DataFrame(articles, columns=sql_db_column_order)
+        return results_df.sort_values("article_date", kind="stable").reset_index(
+            drop=True
+        )
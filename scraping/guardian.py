@@ -3,17 +3,31 @@ Module docstring to keep pylint happy
 """
 
 import datetime
-from typing import Dict, Iterable, Union
+from typing import Dict, Iterable, List, Optional, Union
 
 import requests
 from bs4 import BeautifulSoup as bs  # type: ignore
 from tqdm import tqdm  # type: ignore
 
+from scraping.corpus_store import CorpusStore
+from scraping.quota import (
+    DAILY_LIMIT,
+    PER_SECOND_LIMIT,
+    PRIORITY_LOW,
+    PRIORITY_NORMAL,
+    QuotaExceededError,
+    RateLimiter,
+    ThrottledError,
+)
 from scraping.scraper import df_from_article_dict  # type: ignore
 from scraping.scraper import Scraper, read_config_yaml, save_results_csv
 
 SEARCH_PAGES: Iterable = range(1, 10)
 NEWS_SOURCE_ID = 1
+MAX_RETRIES = 5
+RETRY_STATUS_CODES = (429, 503)
+REQUEST_TIMEOUT = 30
+BACKFILL_PAGE_SIZE = 200  # largest page size the api allows
 
 
 class GuardianAPI:
@@ -21,27 +35,66 @@ class GuardianAPI:
     class to handle the querying of the guardian api
     """
 
-    def __init__(self, search_term: str, api_key: str, search_page: int):
+    def __init__(
+        self,
+        search_term: str,
+        api_key: str,
+        search_page: int,
+        rate_limiter: Optional[RateLimiter] = None,
+        priority: int = PRIORITY_NORMAL,
+        from_date: Optional[datetime.date] = None,
+        to_date: Optional[datetime.date] = None,
+        page_size: Optional[int] = None,
+    ):
         self.search_term = search_term
         self.api_key = api_key
         self.search_page = search_page
-        self.results: Dict
+        self.rate_limiter = rate_limiter or RateLimiter(api_key)
+        self.priority = priority
+        self.from_date = from_date
+        self.to_date = to_date
+        self.page_size = page_size
+        self.results: Optional[Dict] = None
 
     def build_api_query(self) -> str:
         """
         create a string suitable for querying the guardian api
         """
         search_term = self.search_term.replace(" ", "%20")
-        return f"https://content.guardianapis.com/search?page={self.search_page}&q={search_term}&api-key={self.api_key}"
+        query = f"https://content.guardianapis.com/search?page={self.search_page}&q={search_term}&api-key={self.api_key}"
+        if self.from_date is not None:
+            query += f"&from-date={self.from_date.isoformat()}"
+        if self.to_date is not None:
+            query += f"&to-date={self.to_date.isoformat()}"
+        if self.page_size is not None:
+            query += f"&page-size={self.page_size}"
+        return query
 
     def get_api_response(self) -> requests.models.Response:
         """
-        get response from guardian api
+        get response from guardian api.
+        Each call is taken from the key's shared budget first. Throttled responses are
+        reported to the rate limiter, which backs off, and retried up to MAX_RETRIES times.
+        Raises ThrottledError if the api is still returning 429 after the last retry,
+        as the key's quota is then most likely used up on the api's side.
+        Raises requests.HTTPError for any other unsuccessful status code.
         """
         _query = self.build_api_query()
-        api_response = requests.get(
-            _query
-        )  # should add some exception handling for invalid status codes
+        for _ in range(MAX_RETRIES):
+            self.rate_limiter.acquire(self.priority)
+            api_response = requests.get(_query, timeout=REQUEST_TIMEOUT)
+            if api_response.status_code not in RETRY_STATUS_CODES:
+                break
+            retry_after = api_response.headers.get("Retry-After")
+            self.rate_limiter.report_throttled(
+                float(retry_after) if retry_after and retry_after.isdigit() else None
+            )
+        if api_response.status_code == 429:
+            raise ThrottledError(
+                f"Guardian api still returning 429 after {MAX_RETRIES} attempts"
+            )
+        api_response.raise_for_status()
+        self.rate_limiter.report_success()
         return api_response
 
     def parse_api_response(self, result_number: int) -> dict:
@@ -54,18 +107,37 @@ class GuardianAPI:
         This method deliberately only parses one result at a time.
         The intention here is that this method is called in a loop, parsing each result as required.
         The argument result_number should be supplied, calling out which specific result is wanted.
+        The api response is cached, so the api is only queried once per search page.
+        """
+        return self.article_results()[result_number]
+
+    def get_results(self) -> Dict:
+        """
+        returns the "response" part of the api response, querying the api only once
+        """
+        if self.results is None:
+            self.results = self.get_api_response().json()["response"]
+        return self.results
+
+    def total_pages(self) -> int:
         """
-        _response = self.get_api_response()
-        results_list = _response.json()["response"]["results"]
-        article_results = [
-            result for result in results_list if result["type"] == "article"
+        returns the number of search pages available for this query
+        """
+        return self.get_results()["pages"]
+
+    def article_results(self) -> List[dict]:
+        """
+        returns the title, url and date of every article on this search page
+        """
+        return [
+            {
+                "title": result["webTitle"],
+                "url": result["webUrl"],
+                "date": result["webPublicationDate"],
+            }
+            for result in self.get_results()["results"]
+            if result["type"] == "article"
         ]
-        result_dict = {
-            "title": article_results[result_number]["webTitle"],
-            "url": article_results[result_number]["webUrl"],
-            "date": article_results[result_number]["webPublicationDate"],
-        }
-        return result_dict
 
 
 class GuardianArticle(Scraper):
@@ -74,7 +146,7 @@ class GuardianArticle(Scraper):
     """
 
     def __init__(self, url: str):
-        article = requests.get(url)
+        article = requests.get(url, timeout=REQUEST_TIMEOUT)
         self.soup = bs(article.content, "html.parser")
         self.article_date: Union[str, datetime.date]
         self.body: str
@@ -92,41 +164,121 @@ class GuardianArticle(Scraper):
         return self.body
 
 
+def scrape_article(api_result: dict) -> GuardianArticle:
+    """
+    scrapes and cleans the article for one parsed api result
+    """
+    guardian_article = GuardianArticle(api_result["url"])
+    guardian_article.get_body()
+    guardian_article.clean_article(strings_to_remove=None)
+    guardian_article.article_date = api_result["date"]
+    guardian_article.clean_date()
+    return guardian_article
+
+
 def build_article_results_dict(
     search_term: str,
     api_key: str,
     search_pages: Iterable,
     result_nums: Iterable = range(0, 9),
+    rate_limiter: Optional[RateLimiter] = None,
 ) -> Dict:
     """
     main function #to write
+    Search pages the api fails to return and articles that cannot be scraped are
+    skipped. If the daily api budget runs out, or the api keeps throttling a page after
+    every retry, the crawl stops. Either way the articles collected so far are returned.
     """
 
     titles = []
     bodies = []
     dates = []
     urls = []
-    for page in tqdm(search_pages):
-        guardian_api = GuardianAPI(
-            search_term=search_term, api_key=api_key, search_page=page
-        )
-        for result in tqdm(result_nums):
+    rate_limiter = rate_limiter or RateLimiter(api_key)
+    try:
+        for page in tqdm(search_pages):
+            guardian_api = GuardianAPI(
+                search_term=search_term,
+                api_key=api_key,
+                search_page=page,
+                rate_limiter=rate_limiter,
+            )
             try:
-                api_response = guardian_api.parse_api_response(result_number=result)
+                guardian_api.get_results()
+            except requests.RequestException as error:
+                print(f"Skipping search page {page}: {error!r}")
+                continue
+            for result in tqdm(result_nums):
+                try:
+                    api_response = guardian_api.parse_api_response(result_number=result)
+                except IndexError:
+                    print("List of articles available exceeded, breaking...")
+                    break
+                try:
+                    guardian_article = scrape_article(api_response)
+                except (IndexError, requests.RequestException) as error:
+                    print(f"Skipping {api_response['url']}: {error!r}")
+                    continue
                 titles.append(api_response["title"])
                 urls.append(api_response["url"])
-
-                guardian_article = GuardianArticle(api_response["url"])
-                guardian_article.get_body()
-                guardian_article.clean_article(strings_to_remove=None)
-                guardian_article.article_date = api_response["date"]
-                guardian_article.clean_date()
-
                 bodies.append(guardian_article.body)
                 dates.append(guardian_article.article_date)
-            except IndexError:
-                print("List of articles available exceeded, breaking...")
-                break
+    except QuotaExceededError as error:
+        print(f"{error}, stopping crawl")
+    guardian_articles_dict = {
+        "article_title": titles,
+        "article_text": bodies,
+        "source_url": urls,
+        "article_date": dates,
+    }
+    guardian_articles_dict["news_source_id"] = NEWS_SOURCE_ID  # type: ignore
+    return guardian_articles_dict
+
+
+def build_window_results_dict(
+    search_term: str,
+    api_key: str,
+    from_date: datetime.date,
+    to_date: datetime.date,
+    rate_limiter: Optional[RateLimiter] = None,
+) -> Dict:
+    """
+    builds the results dict for every article published between from_date and
+    to_date (inclusive), walking all search pages of the date bounded query.
+    Used for backfills, so api calls are made at low priority. Articles that cannot
+    be scraped are skipped. QuotaExceededError, or requests.RequestException for a
+    search page, is raised rather than returning a partial window.
+    """
+    rate_limiter = rate_limiter or RateLimiter(api_key)
+    titles = []
+    bodies = []
+    dates = []
+    urls = []
+    page = 1
+    total_pages = 1
+    while page <= total_pages:
+        guardian_api = GuardianAPI(
+            search_term=search_term,
+            api_key=api_key,
+            search_page=page,
+            rate_limiter=rate_limiter,
+            priority=PRIORITY_LOW,
+            from_date=from_date,
+            to_date=to_date,
+            page_size=BACKFILL_PAGE_SIZE,
+        )
+        total_pages = guardian_api.total_pages()
+        for api_result in guardian_api.article_results():
+            try:
+                guardian_article = scrape_article(api_result)
+            except (IndexError, requests.RequestException) as error:
+                print(f"Skipping {api_result['url']}: {error!r}")
+                continue
+            titles.append(api_result["title"])
+            urls.append(api_result["url"])
+            bodies.append(guardian_article.body)
+            dates.append(guardian_article.article_date)
+        page += 1
     guardian_articles_dict = {
         "article_title": titles,
         "article_text": bodies,
@@ -137,12 +289,29 @@ def build_article_results_dict(
     return guardian_articles_dict
 
 
+def guardian_rate_limiter(secrets: Dict) -> RateLimiter:
+    """
+    builds the rate limiter for the guardian key in secrets.yml. The key's limits can
+    be set with the optional guardian_per_second and guardian_daily_limit entries.
+    """
+    return RateLimiter(
+        secrets["guardian_api"],
+        per_second=secrets.get("guardian_per_second", PER_SECOND_LIMIT),
+        daily_limit=secrets.get("guardian_daily_limit", DAILY_LIMIT),
+    )
+
+
 def main(search_term: str):
-    API_KEY = read_config_yaml("secrets.yml")["guardian_api"]
+    secrets = read_config_yaml("secrets.yml")
+    API_KEY = secrets["guardian_api"]
     print(f"Scraping guardian site for {search_term} results")
     article_dict = build_article_results_dict(
-        search_term=search_term, api_key=API_KEY, search_pages=SEARCH_PAGES
+        search_term=search_term,
+        api_key=API_KEY,
+        search_pages=SEARCH_PAGES,
+        rate_limiter=guardian_rate_limiter(secrets),
     )
     results = df_from_article_dict(article_dict)
     save_results_csv(results, fname=f"{search_term}_guardian")
+    CorpusStore().append_df(results)
     return None
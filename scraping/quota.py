@@ -0,0 +1,228 @@
+"""
+Module to keep api calls within the rate limits of an api key.
+
+RateLimiter is a token bucket (per second limit) plus a daily call budget. Its state
+is kept in a sqlite ledger so every process using the same key shares one budget,
+e.g. several guardian crawls running in parallel.
+Throttled responses (429) halve the allowed call rate and back off all processes
+exponentially. Each successful call recovers part of the rate.
+Lower priority calls are refused earlier as the daily budget runs out, leaving the
+remainder for higher priority calls.
+"""
+
+import datetime
+import hashlib
+import sqlite3
+import time
+from pathlib import Path
+from typing import Callable, Optional, Union
+
+# guardian developer keys allow 1 call per second and 500 calls per day
+PER_SECOND_LIMIT = 1.0
+DAILY_LIMIT = 500
+PRIORITY_HIGH = 0
+PRIORITY_NORMAL = 1
+PRIORITY_LOW = 2
+# fraction of the daily budget each priority cannot use
+DAILY_RESERVE = {PRIORITY_HIGH: 0.0, PRIORITY_NORMAL: 0.05, PRIORITY_LOW: 0.2}
+PRIORITY_DELAY = 0.05  # extra seconds waited per priority level before retrying
+MIN_RATE_FRACTION = 0.1
+RATE_RECOVERY_FRACTION = 0.05
+MIN_BACKOFF = 1.0
+MAX_BACKOFF = 300.0
+DEFAULT_LEDGER = Path(Path.cwd(), "scraping", "results", "api_ledger.sqlite3")
+LEDGER_COLUMNS = (
+    "tokens",
+    "rate",
+    "updated",
+    "day",
+    "day_count",
+    "backoff",
+    "backoff_until",
+)
+
+
+class QuotaExceededError(Exception):
+    """Raised when the daily budget available to a call's priority is used up"""
+
+    pass
+
+
+class ThrottledError(QuotaExceededError):
+    """
+    Raised when an api still throttles calls after every retry, e.g. because the key's
+    quota is used up on the api's side while the ledger still shows budget left
+    """
+
+    pass
+
+
+class RateLimiter:
+    """
+    token bucket rate limiter with a daily budget, shared across processes through
+    a sqlite ledger. clock and sleep can be replaced for testing.
+    """
+
+    def __init__(
+        self,
+        api_key: str,
+        per_second: float = PER_SECOND_LIMIT,
+        daily_limit: int = DAILY_LIMIT,
+        ledger_path: Union[str, Path] = DEFAULT_LEDGER,
+        clock: Callable[[], float] = time.time,
+        sleep: Callable[[float], None] = time.sleep,
+    ):
+        # the key is hashed so it is never written to disk
+        self.key_id = hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:16]
+        self.per_second = per_second
+        self.capacity = max(1.0, per_second)
+        self.daily_limit = daily_limit
+        self.ledger_path = Path(ledger_path)
+        self.clock = clock
+        self.sleep = sleep
+        self.ledger_path.parent.mkdir(parents=True, exist_ok=True)
+        conn = self._connect()
+        try:
+            conn.execute(
+                """CREATE TABLE IF NOT EXISTS ledger (
+                    key_id TEXT PRIMARY KEY,
+                    tokens REAL NOT NULL,
+                    rate REAL NOT NULL,
+                    updated REAL NOT NULL,
+                    day TEXT NOT NULL,
+                    day_count INTEGER NOT NULL,
+                    backoff REAL NOT NULL,
+                    backoff_until REAL NOT NULL)"""
+            )
+        finally:
+            conn.close()
+
+    def _connect(self) -> sqlite3.Connection:
+        # a new connection per transaction keeps the limiter safe to share between
+        # threads as well as processes
+        return sqlite3.connect(self.ledger_path, timeout=30, isolation_level=None)
+
+    def _today(self, now: float) -> str:
+        utc_now = datetime.datetime.fromtimestamp(now, tz=datetime.timezone.utc)
+        return utc_now.date().isoformat()
+
+    def _update(self, func: Callable[[dict, float], float]) -> float:
+        """
+        runs func on this key's ledger row inside an exclusive transaction.
+        The row is refilled for the time elapsed and the daily count reset on a new
+        (UTC) day before func sees it. Returns func's return value.
+        """
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            now = self.clock()
+            row = conn.execute(
+                f"SELECT {', '.join(LEDGER_COLUMNS)} FROM ledger WHERE key_id = ?",
+                (self.key_id,),
+            ).fetchone()
+            if row is None:
+                state = {
+                    "tokens": self.capacity,
+                    "rate": self.per_second,
+                    "updated": now,
+                    "day": self._today(now),
+                    "day_count": 0,
+                    "backoff": 0.0,
+                    "backoff_until": 0.0,
+                }
+            else:
+                state = dict(zip(LEDGER_COLUMNS, row))
+            elapsed = max(0.0, now - state["updated"])
+            state["tokens"] = min(
+                self.capacity, state["tokens"] + elapsed * state["rate"]
+            )
+            state["updated"] = now
+            if state["day"] != self._today(now):
+                state["day"] = self._today(now)
+                state["day_count"] = 0
+            result = func(state, now)
+            conn.execute(
+                "INSERT OR REPLACE INTO ledger VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (self.key_id, *(state[col] for col in LEDGER_COLUMNS)),
+            )
+            conn.execute("COMMIT")
+            return result
+        except BaseException:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+    def try_acquire(self, priority: int = PRIORITY_NORMAL) -> float:
+        """
+        takes one call from the budget if possible. Returns 0 if the call may be made,
+        otherwise the number of seconds to wait before trying again.
+        Raises QuotaExceededError if the daily budget for this priority is used up.
+        """
+
+        def take(state: dict, now: float) -> float:
+            budget = int(self.daily_limit * (1 - DAILY_RESERVE[priority]))
+            if state["day_count"] >= budget:
+                raise QuotaExceededError(
+                    f"Daily budget of {budget} calls used for priority {priority}"
+                )
+            if now < state["backoff_until"]:
+                return state["backoff_until"] - now
+            if state["tokens"] < 1:
+                return (1 - state["tokens"]) / state["rate"]
+            state["tokens"] -= 1
+            state["day_count"] += 1
+            return 0.0
+
+        return self._update(take)
+
+    def acquire(self, priority: int = PRIORITY_NORMAL) -> None:
+        """
+        blocks until a call may be made, then takes it from the budget.
+        Lower priority callers wait slightly longer between attempts so higher
+        priority callers get freed tokens first.
+        """
+        while True:
+            wait = self.try_acquire(priority)
+            if wait == 0:
+                return None
+            self.sleep(wait + priority * PRIORITY_DELAY)
+
+    def report_success(self) -> None:
+        """
+        records a successful call: recovers part of the call rate and clears backoff
+        """
+
+        def recover(state: dict, now: float) -> None:
+            state["rate"] = min(
+                self.per_second,
+                state["rate"] + self.per_second * RATE_RECOVERY_FRACTION,
+            )
+            state["backoff"] = 0.0
+
+        self._update(recover)
+
+    def report_throttled(self, retry_after: Optional[float] = None) -> None:
+        """
+        records a throttled (429) call: halves the call rate and backs off every
+        process using this key. The backoff doubles on each consecutive throttle and
+        is at least retry_after if the api gave one.
+        """
+
+        def back_off(state: dict, now: float) -> None:
+            backoff = min(MAX_BACKOFF, max(MIN_BACKOFF, state["backoff"] * 2))
+            if retry_after is not None:
+                backoff = max(backoff, retry_after)
+            state["backoff"] = backoff
+            state["backoff_until"] = max(state["backoff_until"], now + backoff)
+            state["rate"] = max(self.per_second * MIN_RATE_FRACTION, state["rate"] / 2)
+            state["tokens"] = 0.0
+
+        self._update(back_off)
+
+    def calls_today(self) -> int:
+        """
+        returns the number of calls made with this key today
+        """
+        return self._update(lambda state, now: state["day_count"])
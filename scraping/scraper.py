@@ -49,22 +49,61 @@ class Scraper:
         return None
 
 
+def _string_dtype() -> str:
+    """
+    returns the arrow backed string dtype if pyarrow is installed, otherwise the
+    default pandas string dtype
+    """
+    try:
+        import pyarrow  # type: ignore # pylint: disable=import-outside-toplevel,unused-import
+    except ImportError:
+        return "string"
+    return "string[pyarrow]"
+
+
+STRING_DTYPE = _string_dtype()
+# dtypes of the article columns, in the sql db column order.
+# article_date is converted with pd.to_datetime rather than astype.
+ARTICLE_DTYPES = {
+    "article_title": STRING_DTYPE,
+    "article_date": "datetime64[ns]",
+    "source_url": STRING_DTYPE,
+    "article_text": STRING_DTYPE,
+    "news_source_id": "category",
+}
+# dtypes to read a results csv with before lean_article_df. news_source_id is read as
+# an integer so its categories are ints rather than strings.
+CSV_READ_DTYPES = {
+    "article_title": STRING_DTYPE,
+    "source_url": STRING_DTYPE,
+    "article_text": STRING_DTYPE,
+    "news_source_id": "int16",
+}
+
+
+def lean_article_df(results_df: pd.DataFrame) -> pd.DataFrame:
+    """
+    converts the article columns of a df to their memory lean dtypes (arrow strings,
+    categorical news source id, datetime64 dates). Converts in place and returns the df.
+    """
+    for col, dtype in ARTICLE_DTYPES.items():
+        if col not in results_df.columns:
+            continue
+        if col == "article_date":
+            results_df[col] = pd.to_datetime(results_df[col])
+        else:
+            results_df[col] = results_df[col].astype(dtype)
+    return results_df
+
+
 def df_from_article_dict(article_results_dict: Dict) -> pd.DataFrame:
     """
-    transforms a results dict to pandas dataframe
+    transforms a results dict to pandas dataframe with memory lean dtypes,
+    in the sql db column order
     """
     results_df = pd.DataFrame.from_dict(article_results_dict)
-    results_df = results_df.dropna().reset_index(drop=True)
-    results_df["id"] = results_df.index
-    sql_db_column_order = [
-        "article_title",
-        "article_date",
-        "source_url",
-        "article_text",
-        "news_source_id",
-    ]
-    results_df = results_df.reindex(columns=sql_db_column_order)
-    return results_df
+    results_df = results_df[list(ARTICLE_DTYPES)].dropna().reset_index(drop=True)
+    return lean_article_df(results_df)
 
 
 def save_results_csv(results_df: pd.DataFrame, fname: str):
@@ -87,6 +126,9 @@ def read_search_config() -> Dict:
         "search_term": parser["searching_params"]["search_term"],
         "save": parser["searching_params"].getboolean("save"),
         "news_source": parser["searching_params"]["news_source"],
+        "sentiment_engine": parser["searching_params"].get(
+            "sentiment_engine", "transformer"
+        ),
     }
     return config_dict
 
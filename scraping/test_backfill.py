@@ -0,0 +1,146 @@
+import datetime
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from scraping import backfill
+from scraping.quota import QuotaExceededError
+
+
+def fake_crawl(dates):
+    return {
+        "article_title": [f"title {i}" for i, _ in enumerate(dates)],
+        "article_text": [f"text {i}" for i, _ in enumerate(dates)],
+        "source_url": [f"https://a.com/{date.isoformat()}" for date in dates],
+        "article_date": dates,
+        "news_source_id": 1,
+    }
+
+
+class TestDateWindows(unittest.TestCase):
+    def test_windows_cover_range(self):
+        windows = backfill.date_windows(
+            datetime.date(2020, 1, 1), datetime.date(2020, 3, 1), window_days=30
+        )
+        self.assertEqual(
+            windows[0], (datetime.date(2020, 1, 1), datetime.date(2020, 1, 30))
+        )
+        self.assertEqual(windows[-1][1], datetime.date(2020, 3, 1))
+        for (_, prev_end), (next_start, _) in zip(windows, windows[1:]):
+            self.assertEqual(next_start - prev_end, datetime.timedelta(days=1))
+
+    def test_end_before_start(self):
+        with self.assertRaises(ValueError):
+            backfill.date_windows(datetime.date(2020, 1, 2), datetime.date(2020, 1, 1))
+
+
+class TestCheckpointDir(unittest.TestCase):
+    def test_dates_in_name(self):
+        first = backfill.checkpoint_dir_for(
+            "bbc", "hs2", datetime.date(2020, 1, 1), datetime.date(2020, 12, 31)
+        )
+        second = backfill.checkpoint_dir_for(
+            "bbc", "hs2", datetime.date(2021, 1, 1), datetime.date(2021, 12, 31)
+        )
+        self.assertEqual(first.name, "hs2_bbc_2020-01-01_2020-12-31")
+        self.assertNotEqual(first, second)
+
+
+class TestCheckpoints(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.checkpoint_dir = Path(self.tmp_dir.name)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_resume_and_combine(self):
+        dates = [datetime.date(2020, 1, 5), datetime.date(2021, 6, 1)]
+        self.assertEqual(
+            backfill.run_partition(self.checkpoint_dir, "a", lambda: fake_crawl(dates)),
+            2,
+        )
+        # a finished partition is not crawled again
+        self.assertIsNone(backfill.run_partition(self.checkpoint_dir, "a", None))
+        backfill.run_partition(self.checkpoint_dir, "b", lambda: fake_crawl(dates[:1]))
+        results = backfill.combine_checkpoints(
+            self.checkpoint_dir, datetime.date(2020, 1, 1), datetime.date(2020, 12, 31)
+        )
+        self.assertEqual(results["source_url"].to_list(), ["https://a.com/2020-01-05"])
+
+
+class TestBackfill(unittest.TestCase):
+    start_date = datetime.date(2020, 1, 1)
+    end_date = datetime.date(2020, 12, 31)
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+        for name, kwargs in [
+            ("BACKFILL_DIR", {"new": Path(self.tmp_dir.name)}),
+            ("save_results_csv", {}),
+            ("CorpusStore", {}),
+            ("run_partition", {"wraps": backfill.run_partition}),
+        ]:
+            patcher = mock.patch.object(backfill, name, **kwargs)
+            self.addCleanup(patcher.stop)
+            setattr(self, name, patcher.start())
+
+    def run_backfill(self, partitions, max_workers=1):
+        with mock.patch.object(
+            backfill, "guardian_partitions", return_value=partitions
+        ):
+            return backfill.backfill(
+                "guardian",
+                "hs2",
+                self.start_date,
+                self.end_date,
+                max_workers=max_workers,
+            )
+
+    def started_partitions(self):
+        return [call.args[1] for call in self.run_partition.call_args_list]
+
+    def test_failed_partition_resumes(self):
+        def failing_crawl():
+            raise ConnectionError("connection reset")
+
+        partitions = {
+            "a": lambda: fake_crawl([datetime.date(2020, 1, 5)]),
+            "b": failing_crawl,
+        }
+        self.assertIsNone(self.run_backfill(partitions))
+        self.save_results_csv.assert_not_called()
+        self.CorpusStore.assert_not_called()
+
+        # on a rerun only the failed partition is crawled again
+        self.run_partition.reset_mock()
+        partitions["b"] = lambda: fake_crawl([datetime.date(2020, 2, 5)])
+        results = self.run_backfill(partitions)
+        self.assertEqual(self.started_partitions(), ["b"])
+        self.assertEqual(len(results), 2)
+        self.save_results_csv.assert_called_once()
+        self.CorpusStore.return_value.append_df.assert_called_once_with(results)
+
+    def test_quota_stops_partitions_not_started(self):
+        def used_up_crawl():
+            raise QuotaExceededError("Daily budget of 400 calls used for priority 2")
+
+        crawls = {name: mock.Mock(side_effect=used_up_crawl) for name in "abc"}
+        self.assertIsNone(self.run_backfill(crawls))
+        # the first partition's error stops the others before they call the api
+        crawls["a"].assert_called_once()
+        crawls["b"].assert_not_called()
+        crawls["c"].assert_not_called()
+        self.save_results_csv.assert_not_called()
+        # the cancelled partitions are still pending on the next run
+        self.run_partition.reset_mock()
+        self.run_backfill(
+            {name: lambda: fake_crawl([datetime.date(2020, 1, 5)]) for name in "abc"}
+        )
+        self.assertEqual(sorted(self.started_partitions()), ["a", "b", "c"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,110 @@
+import datetime
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+import numpy as np  # type: ignore
+import pandas as pd  # type: ignore
+
+from scraping import corpus_store
+from scraping.corpus_store import CorpusStore
+
+
+def make_results_df(urls, dates, news_source_id=1):
+    return pd.DataFrame(
+        {
+            "article_title": [f"title {url}" for url in urls],
+            "article_date": dates,
+            "source_url": urls,
+            "article_text": [f"body of {url} " * 50 for url in urls],
+            "news_source_id": news_source_id,
+        }
+    )
+
+
+class TestCorpusStore(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.store = CorpusStore(self.tmp_dir.name)
+        urls = ["https://a.com/1", "https://a.com/2", "https://a.com/3"]
+        dates = [
+            datetime.date(2022, 1, 1),
+            datetime.date(2022, 2, 1),
+            datetime.date(2022, 3, 1),
+        ]
+        self.written = self.store.append_df(make_results_df(urls, dates))
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_append_skips_stored_urls(self):
+        self.assertEqual(self.written, 3)
+        df = make_results_df(
+            ["https://a.com/1", "https://b.com/1"], [datetime.date(2022, 1, 5)] * 2, 2
+        )
+        self.assertEqual(self.store.append_df(df), 1)
+        self.assertEqual(len(self.store), 4)
+
+    def test_append_after_partial_record(self):
+        with open(self.store.index_path, "ab") as index_file:
+            index_file.write(b"\x00" * 5)
+        df = make_results_df(["https://b.com/1"], [datetime.date(2022, 4, 1)], 2)
+        self.assertEqual(self.store.append_df(df), 1)
+        self.assertEqual(len(self.store), 4)
+        result = self.store.date_range(news_source_id=2)
+        self.assertEqual(result["source_url"].to_list(), ["https://b.com/1"])
+        self.assertEqual(len(self.store.date_range()), 4)
+
+    def test_sidecars_cover_index(self):
+        df = make_results_df(
+            ["https://b.com/2", "https://b.com/1"], [datetime.date(2022, 4, 1)] * 2
+        )
+        self.store.append_df(df)
+        (sidecar,) = self.store._sidecars()
+        self.assertEqual(len(sidecar), 5)
+        self.assertTrue(np.all(sidecar["url_hash"][:-1] <= sidecar["url_hash"][1:]))
+        index = self.store.index()
+        np.testing.assert_array_equal(
+            index["url_hash"][sidecar["record"]], sidecar["url_hash"]
+        )
+
+    def test_missing_sidecar_records(self):
+        # e.g. a store from before sidecars, or an append stopped before its sidecar
+        for path in Path(self.tmp_dir.name).glob("*.hashes"):
+            path.unlink()
+        self.assertEqual(
+            self.store.get("https://a.com/3")["source_url"], "https://a.com/3"
+        )
+        df = make_results_df(
+            ["https://a.com/1", "https://b.com/1"], [datetime.date(2022, 4, 1)] * 2
+        )
+        self.assertEqual(self.store.append_df(df), 1)
+        self.assertEqual(sum(len(sidecar) for sidecar in self.store._sidecars()), 4)
+
+    def test_lookup_across_segments(self):
+        with mock.patch.object(corpus_store, "SEGMENT_MAX_BYTES", 1):
+            for i in range(3):
+                url = f"https://c.com/{i}"
+                self.store.append_df(
+                    make_results_df([url], [datetime.date(2022, 5, 1)])
+                )
+        self.assertEqual(len(self.store._sidecars()), 4)
+        for url in ["https://a.com/1", "https://c.com/0", "https://c.com/2"]:
+            self.assertEqual(self.store.get(url)["source_url"], url)
+
+    def test_get(self):
+        article = self.store.get("https://a.com/2")
+        self.assertEqual(article["article_title"], "title https://a.com/2")
+        self.assertIsNone(self.store.get("https://missing.com"))
+
+    def test_date_range(self):
+        result = self.store.date_range("2022-01-15", datetime.date(2022, 3, 1))
+        self.assertEqual(
+            result["source_url"].to_list(), ["https://a.com/2", "https://a.com/3"]
+        )
+        self.assertTrue(self.store.date_range(news_source_id=2).empty)
+
+
+if __name__ == "__main__":
+    unittest.main()
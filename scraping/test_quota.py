@@ -0,0 +1,209 @@
+import json
+import tempfile
+import types
+import unittest
+from pathlib import Path
+from unittest import mock
+
+import requests
+
+from scraping import guardian
+from scraping.quota import (
+    PRIORITY_HIGH,
+    PRIORITY_LOW,
+    QuotaExceededError,
+    RateLimiter,
+    ThrottledError,
+)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1_650_000_000.0
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+def make_response(status_code, payload=None, headers=None):
+    response = requests.Response()
+    response.status_code = status_code
+    response.headers.update(headers or {})
+    response._content = json.dumps(payload or {}).encode("utf-8")
+    response.url = "https://content.guardianapis.com/search"
+    return response
+
+
+def search_page_response(n_articles, pages=1):
+    results = [
+        {
+            "type": "article",
+            "webTitle": f"title {i}",
+            "webUrl": f"https://www.theguardian.com/{i}",
+            "webPublicationDate": "2022-05-04T12:00:00Z",
+        }
+        for i in range(n_articles)
+    ]
+    return make_response(200, {"response": {"pages": pages, "results": results}})
+
+
+class TestRateLimiter(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.clock = FakeClock()
+        self.ledger = Path(self.tmp_dir.name, "ledger.sqlite3")
+        self.limiter = self.make_limiter()
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def make_limiter(self):
+        return RateLimiter(
+            "api-key",
+            per_second=2,
+            daily_limit=10,
+            ledger_path=self.ledger,
+            clock=self.clock,
+            sleep=self.clock.sleep,
+        )
+
+    def test_token_bucket(self):
+        self.assertEqual(self.limiter.try_acquire(), 0)
+        self.assertEqual(self.limiter.try_acquire(), 0)
+        self.assertAlmostEqual(self.limiter.try_acquire(), 0.5)
+        self.clock.now += 0.5
+        self.assertEqual(self.limiter.try_acquire(), 0)
+
+    def test_budget_shared_through_ledger(self):
+        other_process = self.make_limiter()
+        for _ in range(4):
+            self.limiter.acquire()
+            other_process.acquire()
+        self.assertEqual(self.limiter.calls_today(), 8)
+        # low priority calls cannot use the reserved part of the budget
+        with self.assertRaises(QuotaExceededError):
+            self.limiter.acquire(PRIORITY_LOW)
+        self.limiter.acquire(PRIORITY_HIGH)
+
+    def test_throttled_backs_off(self):
+        self.limiter.report_throttled(retry_after=5)
+        self.assertAlmostEqual(self.limiter.try_acquire(), 5)
+        self.limiter.report_throttled()
+        self.assertAlmostEqual(self.limiter.try_acquire(), 10)
+        self.limiter.acquire()
+        self.limiter.report_success()
+        self.assertEqual(self.limiter.calls_today(), 1)
+
+
+@mock.patch("scraping.guardian.requests.get")
+class TestGuardianAPIThrottling(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.clock = FakeClock()
+        self.limiter = RateLimiter(
+            "api-key",
+            per_second=2,
+            daily_limit=10,
+            ledger_path=Path(self.tmp_dir.name, "ledger.sqlite3"),
+            clock=self.clock,
+            sleep=self.clock.sleep,
+        )
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def make_api(self, search_page=1):
+        return guardian.GuardianAPI(
+            "crossrail", "api-key", search_page, rate_limiter=self.limiter
+        )
+
+    def test_retries_throttled_response_after_retry_after(self, requests_get):
+        requests_get.side_effect = [
+            make_response(429, headers={"Retry-After": "5"}),
+            search_page_response(1),
+        ]
+        start = self.clock.now
+        api_response = self.make_api().get_api_response()
+        self.assertEqual(api_response.status_code, 200)
+        self.assertEqual(requests_get.call_count, 2)
+        # the retry waited out the Retry-After header
+        self.assertGreaterEqual(self.clock.now - start, 5)
+        self.assertEqual(self.limiter.calls_today(), 2)
+
+    def test_gives_up_after_max_retries(self, requests_get):
+        requests_get.return_value = make_response(503)
+        with self.assertRaises(requests.HTTPError):
+            self.make_api().get_api_response()
+        self.assertEqual(requests_get.call_count, guardian.MAX_RETRIES)
+
+    def test_permanent_throttling_raises_throttled_error(self, requests_get):
+        requests_get.return_value = make_response(429)
+        with self.assertRaises(ThrottledError):
+            self.make_api().get_api_response()
+        self.assertEqual(requests_get.call_count, guardian.MAX_RETRIES)
+
+    def test_crawl_stops_on_permanent_throttling(self, requests_get):
+        # the key is used up on the api's side while the ledger still shows budget left
+        requests_get.return_value = make_response(429)
+        results = guardian.build_article_results_dict(
+            "crossrail",
+            "api-key",
+            search_pages=guardian.SEARCH_PAGES,
+            rate_limiter=self.limiter,
+        )
+        self.assertEqual(results["article_title"], [])
+        # only the first page's retries are spent
+        self.assertEqual(requests_get.call_count, guardian.MAX_RETRIES)
+
+    def test_raises_on_other_status_codes(self, requests_get):
+        requests_get.return_value = make_response(401)
+        with self.assertRaises(requests.HTTPError):
+            self.make_api().get_api_response()
+        self.assertEqual(requests_get.call_count, 1)
+
+    def test_api_called_once_per_page(self, requests_get):
+        requests_get.return_value = search_page_response(3, pages=4)
+        guardian_api = self.make_api()
+        titles = [guardian_api.parse_api_response(i)["title"] for i in range(3)]
+        self.assertEqual(titles, ["title 0", "title 1", "title 2"])
+        self.assertEqual(guardian_api.total_pages(), 4)
+        self.assertEqual(requests_get.call_count, 1)
+
+    @mock.patch("scraping.guardian.scrape_article")
+    def test_crawl_keeps_results_after_errors(self, scrape_article, requests_get):
+        # page 2 fails, and the second article on page 1 cannot be fetched
+        requests_get.side_effect = [search_page_response(3), make_response(500)]
+        scrape_article.side_effect = [
+            types.SimpleNamespace(body="body 0", article_date="2022-05-04"),
+            requests.ConnectionError("connection reset"),
+            types.SimpleNamespace(body="body 2", article_date="2022-05-04"),
+        ]
+        results = guardian.build_article_results_dict(
+            "crossrail", "api-key", search_pages=[1, 2], rate_limiter=self.limiter
+        )
+        self.assertEqual(results["article_title"], ["title 0", "title 2"])
+        self.assertEqual(results["article_text"], ["body 0", "body 2"])
+
+    @mock.patch("scraping.guardian.scrape_article")
+    def test_crawl_keeps_results_when_budget_runs_out(
+        self, scrape_article, requests_get
+    ):
+        requests_get.return_value = search_page_response(1)
+        scrape_article.return_value = types.SimpleNamespace(
+            body="body 0", article_date="2022-05-04"
+        )
+        # leave one call of the normal priority budget for page 1
+        for _ in range(8):
+            self.limiter.acquire()
+        results = guardian.build_article_results_dict(
+            "crossrail", "api-key", search_pages=[1, 2], rate_limiter=self.limiter
+        )
+        self.assertEqual(results["article_title"], ["title 0"])
+        self.assertEqual(requests_get.call_count, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,61 @@
+import datetime
+import io
+import unittest
+
+import pandas as pd  # type: ignore
+
+from scraping.scraper import (
+    ARTICLE_DTYPES,
+    CSV_READ_DTYPES,
+    STRING_DTYPE,
+    df_from_article_dict,
+    lean_article_df,
+)
+
+
+def make_article_dict():
+    return {
+        "article_title": ["Crossrail opens", "Crossrail delayed", None],
+        "article_text": ["text 1", "text 2", "text 3"],
+        "source_url": ["https://a.com/1", "https://a.com/2", "https://a.com/3"],
+        "article_date": [
+            datetime.date(2022, 5, 24),
+            datetime.date(2022, 5, 25),
+            datetime.date(2022, 5, 26),
+        ],
+        "news_source_id": 1,
+    }
+
+
+class TestLeanArticleDf(unittest.TestCase):
+    def test_dtypes(self):
+        df = pd.DataFrame(make_article_dict()).dropna()
+        result = lean_article_df(df)
+        # columns are converted in place
+        self.assertIs(result, df)
+        for col in ["article_title", "source_url", "article_text"]:
+            self.assertEqual(result[col].dtype, pd.api.types.pandas_dtype(STRING_DTYPE))
+        self.assertTrue(pd.api.types.is_datetime64_dtype(result["article_date"]))
+        self.assertIsInstance(result["news_source_id"].dtype, pd.CategoricalDtype)
+
+    def test_df_from_article_dict(self):
+        result = df_from_article_dict(make_article_dict())
+        self.assertEqual(list(result.columns), list(ARTICLE_DTYPES))
+        self.assertEqual(len(result), 2)
+        self.assertEqual(list(result.index), [0, 1])
+
+    def test_csv_round_trip_keeps_int_categories(self):
+        csv = io.StringIO()
+        df_from_article_dict(make_article_dict()).to_csv(csv, index=False, sep="|")
+        csv.seek(0)
+        result = lean_article_df(
+            pd.read_csv(
+                csv, sep="|", dtype=CSV_READ_DTYPES, parse_dates=["article_date"]
+            )
+        )
+        self.assertEqual(list(result["news_source_id"].cat.categories), [1])
+        self.assertEqual(result["article_date"][0], pd.Timestamp(2022, 5, 24))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,10 +1,17 @@
 """
 Main module for scraping, performing sentiment analysis, and recording
 results.
+
+Run without arguments to scrape the latest results for the search term in
+input_config.ini. To backfill the articles published over a date range instead:
+    python scraping_main.py --backfill-from 2012-01-01 --backfill-to 2022-01-01
 """
+import argparse
+import datetime
+
 import db_wrangling as dbw
 import sentiment_analysis
-from scraping import bbc, guardian
+from scraping import backfill, bbc, guardian
 from scraping.scraper import read_search_config
 
 
@@ -31,7 +38,9 @@ def scrape_site(news_source: str, search_term: str) -> None:
     return None
 
 
-def perform_sentiment_analysis(news_source: str, search_term: str) -> None:
+def perform_sentiment_analysis(
+    news_source: str, search_term: str, engine: str = "transformer"
+) -> None:
     """undertakes sentiment analysis of the article titles provided by
     the search term and news source csv file specified.
     results are saved in scraping/results/sentiment_analysis_results
@@ -40,11 +49,12 @@ def perform_sentiment_analysis(news_source: str, search_term: str) -> None:
     Args:
         news_source (str): news source to be scraped
         search_term (str): term to be searched and scraped
+        engine (str): sentiment engine, one of transformer, lexicon or hybrid
 
     Returns:
         None
     """
-    sentiment_analysis.main(news_source, search_term)
+    sentiment_analysis.main(news_source, search_term, engine=engine)
     return None
 
 
@@ -69,19 +79,68 @@ def write_to_db(news_source: str, search_term: str) -> None:
     return None
 
 
+def parse_args() -> argparse.Namespace:
+    """parses the optional backfill command line arguments.
+
+    Returns:
+        argparse.Namespace: parsed arguments
+    """
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--backfill-from",
+        type=datetime.date.fromisoformat,
+        help="first article date to backfill (YYYY-MM-DD)",
+    )
+    parser.add_argument(
+        "--backfill-to",
+        type=datetime.date.fromisoformat,
+        default=datetime.date.today(),
+        help="last article date to backfill (YYYY-MM-DD), defaults to today",
+    )
+    parser.add_argument(
+        "--window-days",
+        type=int,
+        default=backfill.WINDOW_DAYS,
+        help="days per guardian backfill window",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=backfill.MAX_WORKERS,
+        help="number of backfill partitions crawled in parallel",
+    )
+    return parser.parse_args()
+
+
 def main():
     """Runs the full program.
     1. Scrape site specified by "news_source" for term "search_term" and
-        save results as csv.
+        save results as csv. With --backfill-from, every article published
+        in the backfill date range is scraped instead.
     2. undertake sentiment analysis of the article titles included in the csv
     3. writes the full csv with sentiment to postgres db.
     """
+    args = parse_args()
     input_config = read_search_config()
     SEARCH_TERM = input_config["search_term"]
     NEWS_SOURCE = input_config["news_source"]
-    scrape_site(NEWS_SOURCE, SEARCH_TERM)
-    perform_sentiment_analysis(NEWS_SOURCE, SEARCH_TERM)
+    SENTIMENT_ENGINE = input_config["sentiment_engine"]
+    if args.backfill_from is None:
+        scrape_site(NEWS_SOURCE, SEARCH_TERM)
+    else:
+        results = backfill.backfill(
+            NEWS_SOURCE,
+            SEARCH_TERM,
+            start_date=args.backfill_from,
+            end_date=args.backfill_to,
+            window_days=args.window_days,
+            max_workers=args.workers,
+        )
+        if results is None:
+            return None
+    perform_sentiment_analysis(NEWS_SOURCE, SEARCH_TERM, SENTIMENT_ENGINE)
     write_to_db(NEWS_SOURCE, SEARCH_TERM)
+    return None
 
 
 if __name__ == "__main__":
@@ -1,15 +1,25 @@
 """
 Uses huggingface transformers to generate
-sentiment analysis on article titles
+sentiment analysis on article titles.
+The cheaper lexicon scorer in lexicon_sentiment can be used instead, or as a
+first pass that only sends low confidence titles to the transformer model (hybrid).
 """
 
 # pylint: disable=line-too-long,invalid-name
+import numpy as np  # type: ignore
 import pandas as pd  # type: ignore
 import transformers  # type: ignore
 from transformers import AutoModelForSequenceClassification, AutoTokenizer
 from typing_extensions import TypeAlias, reveal_type
-from typing import Any
+from typing import Any, Iterable, Iterator, Optional, Union
 
+from lexicon_sentiment import LexiconScorer
+from scraping.scraper import CSV_READ_DTYPES, lean_article_df
+
+CSV_CHUNKSIZE = 10_000
+MODEL_NAME = "distilbert-base-uncased-finetuned-sst-2-english"
+SENTIMENT_ENGINES = ("transformer", "lexicon", "hybrid")
+HYBRID_CONFIDENCE_THRESHOLD = 0.3
 
 TokenizerType: TypeAlias = (
     transformers.models.distilbert.tokenization_distilbert_fast.DistilBertTokenizerFast
@@ -39,61 +49,150 @@ def predict_sentiment(text: str, model: ModelType, tokenizer: TokenizerType) ->
     return tuple(outputs.logits.softmax(dim=-1).tolist())[0]
 
 
-def read_csv(search_term: str, news_source: str) -> pd.DataFrame:
+def predict_sentiment_batch(
+    texts: Iterable[str], model: ModelType, tokenizer: TokenizerType
+) -> np.ndarray:
+    """
+    makes predictions on each of the inputted texts
+    returns an (n, 2) float32 array of [%negative, %positive] results
     """
-    reads in results csv and returns a pandas df
+    texts = list(texts)
+    sentiment_results = np.empty((len(texts), 2), dtype=np.float32)
+    for i, text in enumerate(texts):
+        sentiment_results[i] = predict_sentiment(text, model, tokenizer)
+    return sentiment_results
+
+
+class SentimentPredictor:
+    """
+    Scores texts with one of the SENTIMENT_ENGINES:
+    transformer: the pretrained transformer model (slow, most accurate)
+    lexicon: the vectorised lexicon scorer (fast)
+    hybrid: the lexicon scorer, with texts scoring below confidence_threshold
+        re-scored by the transformer model. The model is only loaded if needed.
+    """
+
+    def __init__(
+        self,
+        engine: str = "transformer",
+        model_name: str = MODEL_NAME,
+        confidence_threshold: float = HYBRID_CONFIDENCE_THRESHOLD,
+    ):
+        if engine not in SENTIMENT_ENGINES:
+            raise ValueError(f"engine must be one of {SENTIMENT_ENGINES}, got {engine}")
+        self.engine = engine
+        self.model_name = model_name
+        self.confidence_threshold = confidence_threshold
+        self.scorer = LexiconScorer() if engine != "transformer" else None
+        self._tokenizer: Optional[TokenizerType] = None
+        self._model: Optional[ModelType] = None
+
+    def _load_transformer(self) -> tuple[TokenizerType, ModelType]:
+        if self._model is None:
+            print(f"Loading model: {self.model_name}")
+            self._tokenizer, self._model = load_model(self.model_name)
+        return self._tokenizer, self._model
+
+    def predict(self, texts: Iterable[str]) -> np.ndarray:
+        """
+        returns an (n, 2) float32 array of [%negative, %positive] results
+        """
+        texts = list(texts)
+        if self.engine == "transformer":
+            tokenizer, model = self._load_transformer()
+            return predict_sentiment_batch(texts, model, tokenizer)
+        sentiment_results = self.scorer.predict(texts)
+        if self.engine == "hybrid":
+            uncertain = np.flatnonzero(
+                self.scorer.confidence(sentiment_results) < self.confidence_threshold
+            )
+            if len(uncertain):
+                tokenizer, model = self._load_transformer()
+                sentiment_results[uncertain] = predict_sentiment_batch(
+                    (texts[i] for i in uncertain), model, tokenizer
+                )
+        return sentiment_results
+
+
+def read_csv(
+    search_term: str, news_source: str, chunksize: Optional[int] = None
+) -> Union[pd.DataFrame, Iterator[pd.DataFrame]]:
+    """
+    reads in results csv and returns a pandas df with memory lean dtypes.
+    If chunksize is given an iterator of dfs with at most chunksize rows is returned instead.
     """
     csv_dir = f"scraping/results/{search_term}_{news_source}.csv"
-    return pd.read_csv(csv_dir, sep="|")
+    reader = pd.read_csv(
+        csv_dir,
+        sep="|",
+        dtype=CSV_READ_DTYPES,
+        parse_dates=["article_date"],
+        chunksize=chunksize,
+    )
+    if chunksize is None:
+        return lean_article_df(reader)
+    return (lean_article_df(chunk) for chunk in reader)
 
 
-def write_csv(df: pd.DataFrame, search_term: str, news_source: str) -> Any:
+def write_csv(
+    df: pd.DataFrame, search_term: str, news_source: str, append: bool = False
+) -> Any:
     """writes a pandas dataframe to csv
 
     Args:
         df (pd.DataFrame): pandas df to write
         search_term (str): search term corresponding to this specific df
-        news_source (str): new source used to gather articles"""
+        news_source (str): new source used to gather articles
+        append (bool): append to an existing csv without writing the header"""
     csv_dir = f"scraping/results/sentiment_analysis_results/{search_term}_{news_source}_sentiment.csv"
-    return df.to_csv(csv_dir, sep="|", index = False)
+    return df.to_csv(
+        csv_dir, sep="|", index=False, mode="a" if append else "w", header=not append
+    )
+
 
 def combine_sentiment_df(
-    article_df: pd.DataFrame, sentiment_results: pd.Series
+    article_df: pd.DataFrame, sentiment_results: Union[pd.Series, np.ndarray]
 ) -> pd.DataFrame:
-    """Combines the sentiment analysis results with the original article df
+    """Adds the sentiment analysis results to the original article df as float32
+    negative/positive columns. The columns are assigned in place, the article df is not copied.
 
     Args:
         article_df (pd.DataFrame): df containing the article text, title, date etc
-        sentiment_results (pd.Series): pd series containing the negative/positive results of the article sentiment
+        sentiment_results (pd.Series | np.ndarray): pd series of (negative, positive) tuples or an (n, 2) array of the article sentiment
 
     Returns:
         pd.DataFrame: df wih sentiment results merged with article df
     """
-    temp_df = pd.DataFrame(
-        sentiment_results.to_list(), columns=["negative", "positive"]
-    )
-    combined_df = pd.concat([article_df, temp_df], axis=1, join="inner")
-    del temp_df
-    return combined_df
+    if isinstance(sentiment_results, pd.Series):
+        sentiment_results = sentiment_results.to_list()
+    scores = np.asarray(sentiment_results, dtype=np.float32).reshape(-1, 2)
+    article_df["negative"] = scores[:, 0]
+    article_df["positive"] = scores[:, 1]
+    return article_df
 
 
-def main(news_source:str, search_term:str) -> None:
+def main(news_source: str, search_term: str, engine: str = "transformer") -> None:
     """
-    main function to call predictions
+    main function to call predictions.
+    engine is one of SENTIMENT_ENGINES, see SentimentPredictor.
     """
-    MODEL_NAME = "distilbert-base-uncased-finetuned-sst-2-english"
-    print("Loading csv...")
-    df = read_csv(search_term=search_term, news_source=news_source)
-    print(f"Loading model: {MODEL_NAME}")
-    tokenizer, model = load_model(MODEL_NAME)
-    print("Performing analysis...")
-    sentiment_results = df["article_title"].apply(
-        predict_sentiment, args=(model, tokenizer)
-    )
-    combined_df = combine_sentiment_df(
-        article_df=df, sentiment_results=sentiment_results
+    predictor = SentimentPredictor(engine=engine)
+    print(f"Performing analysis using the {engine} engine...")
+    # the csv is scored and written in chunks so peak memory is bounded by CSV_CHUNKSIZE
+    # rather than the size of the corpus
+    chunks = read_csv(
+        search_term=search_term, news_source=news_source, chunksize=CSV_CHUNKSIZE
     )
-    print("Saving to csv")
-    write_csv(combined_df, search_term=search_term, news_source=news_source)
+    for chunk_num, df in enumerate(chunks):
+        sentiment_results = predictor.predict(df["article_title"])
+        combined_df = combine_sentiment_df(
+            article_df=df, sentiment_results=sentiment_results
+        )
+        write_csv(
+            combined_df,
+            search_term=search_term,
+            news_source=news_source,
+            append=chunk_num > 0,
+        )
     print(f"Sentiment analysis of {search_term} from {news_source} saved to csv.")
     return None
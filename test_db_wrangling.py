@@ -0,0 +1,274 @@
+import datetime
+import decimal
+import os
+import tempfile
+import unittest
+from collections import namedtuple
+from pathlib import Path
+
+import numpy as np  # type: ignore
+import pandas as pd  # type: ignore
+from psycopg2 import sql  # type: ignore
+
+import db_wrangling as dbw
+
+Column = namedtuple("Column", ["name", "type_code"])
+DESCRIPTION = [
+    Column("id", 23),
+    Column("score", 700),
+    Column("article_date", 1082),
+    Column("title", 25),
+    Column("amount", 1700),
+    Column("fetched", 1184),
+]
+ROWS = [
+    (
+        1,
+        0.25,
+        datetime.date(2022, 5, 4),
+        "crossrail opens",
+        decimal.Decimal("1.5"),
+        datetime.datetime(2022, 5, 4, 12, tzinfo=datetime.timezone.utc),
+    ),
+    (None, None, None, None, None, None),
+]
+
+
+class FakeNamedCursor:
+    def __init__(self, rows, description):
+        self.rows = list(rows)
+        self.description = description
+        self.itersize = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+    def execute(self, query, params=None):
+        self.query = render(query)
+
+    def fetchmany(self, size):
+        chunk, self.rows = self.rows[:size], self.rows[size:]
+        return chunk
+
+
+def render(query):
+    """renders a query without a connection, quoting identifiers like postgres"""
+    if isinstance(query, sql.Composed):
+        return "".join(render(part) for part in query)
+    if isinstance(query, sql.SQL):
+        return query.string
+    if isinstance(query, sql.Identifier):
+        return ".".join(f'"{string}"' for string in query.strings)
+    return query
+
+
+class FakeCursor:
+    """
+    records the statements executed and returns the rows given for the first query
+    fragment found in each statement
+    """
+
+    def __init__(self, results=None, description=None):
+        self.results = results or {}
+        self.description = description
+        self.executed = []
+        self.rows = []
+
+    def execute(self, query, params=None):
+        text = render(query)
+        self.executed.append((text, params))
+        self.rows = next(
+            (rows for fragment, rows in self.results.items() if fragment in text), []
+        )
+
+    def fetchall(self):
+        return list(self.rows)
+
+    def fetchone(self):
+        return self.rows[0] if self.rows else None
+
+    def copy_expert(self, sql, file):
+        self.executed.append((render(sql), file.read()))
+
+    def statements(self, fragment):
+        return [(text, params) for text, params in self.executed if fragment in text]
+
+
+class FakeConnection:
+    def __init__(self, rows=(), description=(), cursor=None):
+        self.named_cursor = FakeNamedCursor(rows, description)
+        self.plain_cursor = cursor
+        self.commits = 0
+
+    def cursor(self, name=None):
+        return self.named_cursor if name else self.plain_cursor
+
+    def commit(self):
+        self.commits += 1
+
+
+class TestFrameFromRows(unittest.TestCase):
+    def test_typed_columns(self):
+        df = dbw.frame_from_rows(ROWS, DESCRIPTION)
+        self.assertEqual(df["id"].dtype, "Int32")
+        self.assertEqual(df["score"].dtype, np.float32)
+        self.assertTrue(pd.api.types.is_datetime64_dtype(df["article_date"]))
+        self.assertIsInstance(df["title"].dtype, pd.StringDtype)
+        self.assertEqual(df["amount"].dtype, np.float64)
+        self.assertEqual(str(df["fetched"].dt.tz), "UTC")
+
+    def test_nulls(self):
+        df = dbw.frame_from_rows(ROWS, DESCRIPTION)
+        self.assertTrue(df.iloc[1].isna().all())
+        self.assertEqual(df["id"].iloc[0], 1)
+        self.assertEqual(df["amount"].iloc[0], 1.5)
+
+    def test_no_rows(self):
+        df = dbw.frame_from_rows([], DESCRIPTION)
+        self.assertEqual(list(df.columns), [col.name for col in DESCRIPTION])
+        self.assertEqual(df["id"].dtype, "Int32")
+
+
+class TestStreamQuery(unittest.TestCase):
+    def setUp(self):
+        rows = [(i, float(i)) for i in range(5)]
+        description = [Column("id", 23), Column("score", 700)]
+        self.conn = FakeConnection(rows, description)
+        self.db = dbw.DataBase(_conn=self.conn)
+
+    def test_chunks_as_numpy(self):
+        chunks = list(self.db.stream_query("SELECT", chunksize=2, as_numpy=True))
+        self.assertEqual([len(chunk["id"]) for chunk in chunks], [2, 2, 1])
+        self.assertEqual(chunks[0]["score"].dtype, np.float32)
+        self.assertEqual(self.conn.named_cursor.itersize, 2)
+
+    def test_timestamptz_as_numpy(self):
+        conn = FakeConnection(ROWS[:1], DESCRIPTION)
+        chunk = next(dbw.DataBase(_conn=conn).stream_query("SELECT", as_numpy=True))
+        self.assertTrue(np.issubdtype(chunk["fetched"].dtype, np.datetime64))
+
+    def test_stream_articles(self):
+        chunks = list(self.db.stream_articles("HS2", columns=["id", "score"]))
+        self.assertIn('FROM "hs2"', self.conn.named_cursor.query)
+        self.assertEqual(len(chunks[0]), 5)
+
+    def test_chunks_as_frames(self):
+        chunks = list(self.db.stream_query("SELECT", chunksize=3))
+        self.assertEqual(sum(len(chunk) for chunk in chunks), 5)
+        self.assertIsInstance(chunks[0], pd.DataFrame)
+
+
+class TestCreateSchema(unittest.TestCase):
+    def make_db(self, results):
+        self.cursor = FakeCursor(results)
+        return dbw.DataBase(_conn=FakeConnection(cursor=self.cursor))
+
+    def test_migrates_table_without_unique_url_index(self):
+        dates = [datetime.date(2022, 1, 1), datetime.date(2022, 1, 2)]
+        db = self.make_db(
+            {"pg_indexes": [], "SELECT DISTINCT article_date": [(d,) for d in dates]}
+        )
+        db.create_schema("HS2")
+        self.assertEqual(
+            self.cursor.statements("pg_indexes")[0][1], ("hs2_source_url_key",)
+        )
+        self.assertEqual(len(self.cursor.statements("USING")), 1)
+        self.assertEqual(len(self.cursor.statements("CREATE UNIQUE INDEX")), 1)
+        # every existing date is rolled up
+        refresh = self.cursor.statements('DELETE FROM "hs2_daily_sentiment"')
+        self.assertEqual(sorted(refresh[0][1][0]), dates)
+
+    def test_existing_unique_url_index(self):
+        db = self.make_db({"pg_indexes": [(1,)]})
+        db.create_schema("hs2")
+        self.assertEqual(self.cursor.statements("USING"), [])
+        self.assertEqual(self.cursor.statements("SELECT DISTINCT"), [])
+        self.assertEqual(self.cursor.statements("CREATE UNIQUE INDEX"), [])
+        self.assertEqual(
+            self.cursor.statements('DELETE FROM "hs2_daily_sentiment"'), []
+        )
+
+    def test_refreshes_rollup_rows_without_score_counts(self):
+        db = self.make_db(
+            {"pg_indexes": [(1,)], "n_negative IS NULL": [(datetime.date(2022, 1, 1),)]}
+        )
+        db.create_schema("hs2")
+        refresh = self.cursor.statements('DELETE FROM "hs2_daily_sentiment"')
+        self.assertEqual(refresh[0][1], ([datetime.date(2022, 1, 1)],))
+
+
+class TestSendCsvToPsql(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+        self.addCleanup(os.chdir, os.getcwd())
+        os.chdir(self.tmp_dir.name)
+        results_dir = Path("scraping", "results", "sentiment_analysis_results")
+        results_dir.mkdir(parents=True)
+        Path(results_dir, "HS2_guardian_sentiment.csv").write_text(
+            "|".join(dbw.ARTICLE_COLUMNS) + "\n", encoding="utf-8"
+        )
+
+    def test_refreshes_inserted_dates_only(self):
+        inserted = [
+            (datetime.date(2022, 1, 1),),
+            (datetime.date(2022, 1, 1),),
+            (None,),
+            (datetime.date(2022, 1, 3),),
+        ]
+        cursor = FakeCursor({"pg_indexes": [(1,)], "RETURNING article_date": inserted})
+        conn = FakeConnection(cursor=cursor)
+        dbw.DataBase(_conn=conn).send_csv_to_psql("HS2", "guardian", "HS2")
+        self.assertEqual(len(cursor.statements('COPY "hs2_staging"')), 1)
+        self.assertEqual(len(cursor.statements('INSERT INTO "hs2" ')), 1)
+        refresh = cursor.statements('DELETE FROM "hs2_daily_sentiment"')
+        self.assertEqual(len(refresh), 1)
+        self.assertEqual(
+            sorted(refresh[0][1][0]),
+            [datetime.date(2022, 1, 1), datetime.date(2022, 1, 3)],
+        )
+        self.assertEqual(conn.commits, 1)
+
+
+class TestSentimentTrend(unittest.TestCase):
+    def setUp(self):
+        description = [
+            Column(name, 0)
+            for name in [
+                "period",
+                "news_source_id",
+                "n_articles",
+                "mean_negative",
+                "mean_positive",
+                "rolling_negative",
+                "rolling_positive",
+            ]
+        ]
+        self.cursor = FakeCursor(description=description)
+        self.db = dbw.DataBase(_conn=FakeConnection(cursor=self.cursor))
+
+    def test_validation(self):
+        with self.assertRaises(ValueError):
+            self.db.sentiment_trend("hs2", freq="year")
+        with self.assertRaises(ValueError):
+            self.db.sentiment_trend("hs2", window=0)
+        self.assertEqual(self.cursor.executed, [])
+
+    def test_params(self):
+        trend_df = self.db.sentiment_trend("HS2", freq="week", window=4)
+        ((text, params),) = self.cursor.executed
+        self.assertIn('FROM "hs2_daily_sentiment"', text)
+        self.assertEqual(params["freq"], "week")
+        self.assertEqual(params["preceding"], "3 week")
+        self.assertIsNone(params["news_source_id"])
+        self.assertTrue(trend_df.empty)
+        self.db.sentiment_trend("hs2", window=1, news_source_id=2)
+        self.assertEqual(self.cursor.executed[-1][1]["preceding"], "0 day")
+        self.assertEqual(self.cursor.executed[-1][1]["news_source_id"], 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,81 @@
+import tempfile
+import unittest
+from pathlib import Path
+
+import numpy as np  # type: ignore
+
+from lexicon_sentiment import LexiconScorer, load_vader_lexicon
+
+
+class TestLexiconScorer(unittest.TestCase):
+    def setUp(self):
+        self.scorer = LexiconScorer()
+
+    def score(self, text):
+        return float(self.scorer.compound([text])[0])
+
+    def test_polarity(self):
+        self.assertGreater(self.score("HS2 is a great success"), 0.5)
+        self.assertLess(self.score("Crossrail delays are a disaster"), -0.5)
+        self.assertEqual(self.score("The report is published today"), 0)
+
+    def test_negation(self):
+        positive = self.score("the line is a success")
+        negated = self.score("the line is not a success")
+        self.assertLess(negated, 0)
+        # negation flips and damps the valence
+        self.assertLess(abs(negated), positive)
+        # negations further back than NEGATION_WINDOW words have no effect
+        self.assertEqual(self.score("not that the new line is a success"), positive)
+
+    def test_boosters(self):
+        bad = self.score("bad")
+        self.assertLess(self.score("very bad"), bad)
+        self.assertGreater(self.score("slightly bad"), bad)
+        self.assertGreater(self.score("very good"), self.score("good"))
+
+    def test_but(self):
+        # the clause after "but" outweighs the clause before it
+        self.assertLess(self.score("good progress but bad delays"), 0)
+        self.assertGreater(self.score("bad delays but good progress"), 0)
+
+    def test_empty_and_non_string(self):
+        results = self.scorer.predict(["", None, float("nan"), "   "])
+        np.testing.assert_array_equal(results, np.full((4, 2), 0.5, dtype=np.float32))
+        self.assertEqual(self.scorer.predict([]).shape, (0, 2))
+
+    def test_term_ids_keep_document_boundaries(self):
+        ids, doc_ids, n_docs = self.scorer._term_ids(["a good", "", None, "bad"])
+        self.assertEqual(n_docs, 4)
+        np.testing.assert_array_equal(doc_ids, [0, 0, 3])
+        np.testing.assert_array_equal(
+            ids, [0, self.scorer.vocab["good"], self.scorer.vocab["bad"]]
+        )
+
+    def test_rules_stop_at_document_boundaries(self):
+        # negations, boosters and "but" do not carry over into the next text
+        good, bad = self.scorer.compound(["good", "bad"])
+        np.testing.assert_array_equal(
+            self.scorer.compound(["not", "good", "very", "bad", "good but", "bad"]),
+            np.array([0, good, 0, bad, self.score("good but"), bad], dtype=np.float32),
+        )
+
+
+class TestLoadVaderLexicon(unittest.TestCase):
+    def test_load(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            filename = Path(tmp_dir, "vader_lexicon.txt")
+            filename.write_text(
+                "Superb\t3.1\t0.7\t[3, 3, 4]\nawful\t-2.0\t0.9\t[-2, -2, -2]\nbroken line\n",
+                encoding="utf-8",
+            )
+            lexicon = load_vader_lexicon(filename)
+        self.assertEqual(lexicon, {"superb": 3.1, "awful": -2.0})
+        scorer = LexiconScorer(lexicon)
+        self.assertGreater(scorer.compound(["a superb result"])[0], 0)
+        # words from the default lexicon are not scored with a custom lexicon
+        self.assertEqual(scorer.compound(["a great success"])[0], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,87 @@
+import unittest
+from unittest import mock
+
+import numpy as np  # type: ignore
+import pandas as pd  # type: ignore
+
+import sentiment_analysis
+
+
+class TestCombineSentimentDf(unittest.TestCase):
+    def setUp(self):
+        self.article_df = pd.DataFrame(
+            {"article_title": ["a", "b"], "news_source_id": [1, 1]}
+        )
+
+    def test_array_assigned_in_place(self):
+        scores = np.array([[0.1, 0.9], [0.8, 0.2]])
+        result = sentiment_analysis.combine_sentiment_df(self.article_df, scores)
+        self.assertIs(result, self.article_df)
+        self.assertEqual(result["negative"].dtype, np.float32)
+        self.assertEqual(result["positive"].dtype, np.float32)
+        np.testing.assert_allclose(result["negative"], [0.1, 0.8], rtol=1e-6)
+
+    def test_series_of_tuples(self):
+        scores = pd.Series([(0.1, 0.9), (0.8, 0.2)])
+        result = sentiment_analysis.combine_sentiment_df(self.article_df, scores)
+        self.assertEqual(result["positive"].dtype, np.float32)
+        np.testing.assert_allclose(result["positive"], [0.9, 0.2], rtol=1e-6)
+
+
+class TestSentimentPredictor(unittest.TestCase):
+    texts = ["HS2 is a great success", "The report is published", "Crossrail chaos"]
+
+    def setUp(self):
+        # stub out the transformer model, recording the texts it is asked to score
+        self.transformer_texts = []
+        self.load_model = self.patch("load_model", return_value=("tokenizer", "model"))
+        self.patch(
+            "predict_sentiment_batch", side_effect=self.fake_predict_sentiment_batch
+        )
+
+    def patch(self, name, **kwargs):
+        patcher = mock.patch.object(sentiment_analysis, name, **kwargs)
+        self.addCleanup(patcher.stop)
+        return patcher.start()
+
+    def fake_predict_sentiment_batch(self, texts, model, tokenizer):
+        texts = list(texts)
+        self.transformer_texts.extend(texts)
+        return np.tile(np.array([0.25, 0.75], dtype=np.float32), (len(texts), 1))
+
+    def test_hybrid_only_rescores_low_confidence(self):
+        predictor = sentiment_analysis.SentimentPredictor(engine="hybrid")
+        results = predictor.predict(self.texts)
+        self.assertEqual(self.transformer_texts, ["The report is published"])
+        np.testing.assert_array_equal(results[1], [0.25, 0.75])
+        lexicon_results = predictor.scorer.predict(self.texts)
+        np.testing.assert_array_equal(results[[0, 2]], lexicon_results[[0, 2]])
+
+    def test_hybrid_does_not_load_model_when_confident(self):
+        predictor = sentiment_analysis.SentimentPredictor(engine="hybrid")
+        predictor.predict([self.texts[0], self.texts[2]])
+        self.load_model.assert_not_called()
+        self.assertEqual(self.transformer_texts, [])
+
+    def test_lexicon_never_uses_model(self):
+        results = sentiment_analysis.SentimentPredictor(engine="lexicon").predict(
+            self.texts
+        )
+        self.assertEqual(results.shape, (3, 2))
+        self.load_model.assert_not_called()
+
+    def test_transformer_scores_every_text(self):
+        predictor = sentiment_analysis.SentimentPredictor(engine="transformer")
+        predictor.predict(self.texts)
+        predictor.predict(self.texts)
+        # the model is loaded once and reused
+        self.load_model.assert_called_once()
+        self.assertEqual(self.transformer_texts, self.texts * 2)
+
+    def test_unknown_engine(self):
+        with self.assertRaises(ValueError):
+            sentiment_analysis.SentimentPredictor(engine="vader")
+
+
+if __name__ == "__main__":
+    unittest.main()